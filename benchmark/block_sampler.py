@@ -0,0 +1,54 @@
+"""Compare the full shuffle and the block-shuffled sampler on a memmap.
+
+Reads batches from a memory-mapped array like `fit` does and reports the
+throughput and the randomness of the block sampler. Drop the page cache
+before a run (or use an array larger than RAM) to measure the disk.
+
+Run from the repository root:
+    python -m benchmark.block_sampler --path images.npy --batch_size 64
+"""
+import argparse
+import time
+import numpy as np
+from src.utils import input_pipeline
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--path', type=str, required=True)
+parser.add_argument('--batch_size', type=int, default=64)
+parser.add_argument('--steps', type=int, default=200)
+parser.add_argument('--block_sizes', type=int, nargs='+', default=[64, 256, 1024])
+parser.add_argument('--buffer_size', type=int, default=4096)
+pargs = parser.parse_args()
+
+def measure(dataset, read_stats):
+    iterator = iter(dataset)
+    next(iterator)
+    read_stats.reset()
+    time_start = time.time()
+    for _ in range(pargs.steps):
+        next(iterator)
+    elapsed = time.time() - time_start
+    return pargs.steps / elapsed, read_stats.get_throughput()
+
+if __name__ == '__main__':
+    images = np.load(pargs.path, mmap_mode='r')
+    N = images.shape[0]
+
+    read_stats = input_pipeline.ReadStats()
+    dataset = input_pipeline.make_image_dataset(
+        images, pargs.batch_size, read_stats=read_stats)
+    steps_per_sec, mb_per_sec = measure(dataset, read_stats)
+    print('{:18s} {:8.1f} steps/s  {:10.1f} MB/s  randomness {:.3f}'.format(
+        'shuffle', steps_per_sec, mb_per_sec, 1.0))
+
+    for block_size in pargs.block_sizes:
+        read_stats = input_pipeline.ReadStats()
+        dataset = input_pipeline.make_block_shuffled_dataset(
+            images, pargs.batch_size, block_size=block_size,
+            buffer_size=pargs.buffer_size, read_stats=read_stats)
+        steps_per_sec, mb_per_sec = measure(dataset, read_stats)
+        randomness = input_pipeline.block_shuffle_randomness(
+            N, pargs.batch_size, block_size=block_size,
+            buffer_size=pargs.buffer_size)
+        print('{:18s} {:8.1f} steps/s  {:10.1f} MB/s  randomness {:.3f}'.format(
+            'block {:d}'.format(block_size), steps_per_sec, mb_per_sec, randomness))
@@ -0,0 +1,19 @@
+"""Shared setup of the benchmarks."""
+from params import Params
+
+def synthetic_params(res=None, **kwargs):
+    """Return Params that train on the synthetic dataset at `res`.
+
+    `res` defaults to the resolution of Params. Other attributes of Params
+    are overridden by `kwargs`; None values are ignored.
+    """
+    p = Params()
+    if res is None:
+        res = p.image_shape[0]
+    p.image_shape = (res, res, 3)
+    p.dataset_train = 'synthetic{:d}'.format(res)
+    p.dataset_eval = None
+    for name, value in kwargs.items():
+        if value is not None:
+            setattr(p, name, value)
+    return p
@@ -0,0 +1,70 @@
+"""Measure the D step with the fake images generated inside and outside the tape.
+
+`train_disc` generates the fake images before its tape. The old step, which
+recorded the generator on the tape, is rebuilt here for comparison.
+Prints the step time and, on a GPU, the peak memory of the step.
+Uses the synthetic dataset, so no dataset files are needed.
+
+Run from the repository root:
+    python -m benchmark.disc_tape --res 256 512 --steps 20
+"""
+import argparse
+import time
+import tensorflow as tf
+from benchmark.common import synthetic_params
+from src.model.stylegan.executor import StyleGAN
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--res', type=int, nargs='+', default=[256, 512])
+parser.add_argument('--batch_size', type=int, default=None)
+parser.add_argument('--steps', type=int, default=20)
+pargs = parser.parse_args()
+
+def make_train_disc_in_tape(model):
+    """Return the D step that generates the fake images inside the tape."""
+    @tf.function
+    def train_disc(iterator, lod, lod_phase=None):
+        z, images, *noises = next(iterator)
+        with tf.GradientTape() as tape:
+            images_gen = model.generate(z, lod, noises, lod_phase=lod_phase)
+            loss = model.get_disc_loss(images, images_gen, lod, lod_phase)
+        trainable_vars = model.discriminator.trainable_variables
+        grads = tape.gradient(loss, trainable_vars)
+        model.optimizer_disc.apply_gradients(zip(grads, trainable_vars))
+        return loss
+    return train_disc
+
+def get_peak_memory():
+    """Return the peak GPU memory in MB since the last call, or None."""
+    if not tf.config.list_physical_devices('GPU'):
+        return None
+    peak = tf.config.experimental.get_memory_info('GPU:0')['peak']
+    tf.config.experimental.reset_memory_stats('GPU:0')
+    return peak / 2 ** 20
+
+if __name__ == '__main__':
+    for res in pargs.res:
+        p = synthetic_params(res, device_dataset=False, noise_in_graph=False,
+                             batch_size=pargs.batch_size)
+        G = StyleGAN(p, mode='static')
+        lod = G.get_maximum_lod()
+        lod_input = G.convert_lod(lod)
+        lod_phase = G.get_lod_phase(lod)
+        iterator_disc, _ = G.make_train_iterators(
+            G.get_images_at_lod(lod), lod_phase=lod_phase)
+
+        steps = [('inside', make_train_disc_in_tape(G.model)),
+                 ('outside', G.model.train_disc)]
+        for name, train_disc in steps:
+            # The first step traces the graph.
+            float(train_disc(iterator_disc, lod_input, lod_phase=lod_phase))
+            get_peak_memory()
+            time_start = time.time()
+            for _ in range(pargs.steps):
+                d_loss = train_disc(iterator_disc, lod_input, lod_phase=lod_phase)
+            float(d_loss)
+            elapsed = time.time() - time_start
+            peak = get_peak_memory()
+            print('{:4d}x{:<4d} fakes {:7s} {:8.2f} ms/step  peak {}'.format(
+                res, res, name, 1000 * elapsed / pargs.steps,
+                'n/a' if peak is None else '{:.0f} MB'.format(peak)))
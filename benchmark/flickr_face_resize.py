@@ -0,0 +1,33 @@
+"""Compare the resize methods of the Flickr-Faces-HQ loader.
+
+Run from the repository root:
+    python -m benchmark.flickr_face_resize --res 256 --num_images 1000
+"""
+import argparse
+import time
+import numpy as np
+from src.dataset import flickr_face
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--res', type=int, default=256)
+parser.add_argument('--num_images', type=int, default=1000)
+parser.add_argument('--num_workers', type=int, default=None)
+pargs = parser.parse_args()
+
+if __name__ == '__main__':
+    dataset_dir, resize_flag = flickr_face.get_source(pargs.res)
+    idx_range = (0, pargs.num_images)
+
+    results = {}
+    for method in flickr_face.RESIZE_METHODS:
+        time_start = time.time()
+        results[method] = flickr_face.read_images(
+            dataset_dir, pargs.res, resize_flag, idx_range=idx_range,
+            num_workers=pargs.num_workers, resize_method=method)
+        elapsed = time.time() - time_start
+
+        diff = np.abs(results[method].astype(np.int32) -
+                      results['bicubic'].astype(np.int32))
+        print('{:8s} {:10.1f} images/s  '
+              'diff from bicubic: mean {:.3f} max {:d}'.format(
+                  method, pargs.num_images / elapsed, diff.mean(), diff.max()))
@@ -0,0 +1,47 @@
+"""Measure host time and transfer bytes per step of the real image batch.
+
+Compares converting the batch to float32 on the host, as `StyleGAN.fit`
+did before, with sending the uint8 batch that the model converts itself.
+
+Run from the repository root:
+    python -m benchmark.host_input --res 256 --batch_size 64
+"""
+import argparse
+import time
+import numpy as np
+from params import Params
+from src.utils import image_utils
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--res', type=int, default=None)
+parser.add_argument('--batch_size', type=int, default=None)
+parser.add_argument('--num_images', type=int, default=10000)
+parser.add_argument('--steps', type=int, default=100)
+pargs = parser.parse_args()
+
+if __name__ == '__main__':
+    p = Params()
+    image_shape = p.image_shape
+    if pargs.res is not None:
+        image_shape = (pargs.res, pargs.res, image_shape[-1])
+    batch_size = p.batch_size if pargs.batch_size is None else pargs.batch_size
+    images = np.random.randint(
+        0, 256, (pargs.num_images,) + tuple(image_shape), dtype=np.uint8)
+
+    def host_float32(indices):
+        return image_utils.convert_color_range(
+            images[indices], input_range=(0, 255), output_range=(-1, 1))
+
+    def host_uint8(indices):
+        return images[np.sort(indices)]
+
+    for name, func in [('float32 on host', host_float32),
+                       ('uint8 to graph', host_uint8)]:
+        elapsed = 0
+        for _ in range(pargs.steps):
+            indices = np.random.choice(pargs.num_images, batch_size, replace=False)
+            time_start = time.time()
+            batch = func(indices)
+            elapsed += time.time() - time_start
+        print('{:16s} {:8.3f} ms/step  {:10.3f} MB/step'.format(
+            name, 1000 * elapsed / pargs.steps, batch.nbytes / 2 ** 20))
@@ -0,0 +1,53 @@
+"""Measure the mapping network of a training step: two passes vs one batched pass.
+
+Compares mapping `z` and the second latent of style mixing in two passes
+with `StyleGANModel.map_latents`, which maps both in one pass over the
+concatenated batch, and with the single latent computed at eval.
+
+Run from the repository root:
+    python -m benchmark.mapping_pass --batch_size 32 --steps 200
+"""
+import argparse
+import time
+import tensorflow as tf
+from params import Params
+from src.model.stylegan.model import StyleGANModel
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--res', type=int, default=None)
+parser.add_argument('--batch_size', type=int, default=None)
+parser.add_argument('--steps', type=int, default=200)
+pargs = parser.parse_args()
+
+if __name__ == '__main__':
+    p = Params()
+    if pargs.res is not None:
+        p.image_shape = (pargs.res, pargs.res, 3)
+    batch_size = p.batch_size if pargs.batch_size is None else pargs.batch_size
+    model = StyleGANModel(p, mode='static')
+
+    @tf.function
+    def two_passes(z):
+        z2 = tf.random.normal(tf.shape(z))
+        return model.generator_mapping(z), model.generator_mapping(z2)
+
+    @tf.function
+    def batched_pass(z):
+        return model.map_latents(z, training=True)
+
+    @tf.function
+    def eval_pass(z):
+        return model.map_latents(z, training=False)
+
+    z = tf.random.normal([batch_size, model.z_dim])
+    for name, func in [('two passes', two_passes),
+                       ('batched pass', batched_pass),
+                       ('eval (latent1 only)', eval_pass)]:
+        # The first call traces the graph.
+        func(z)[0].numpy()
+        time_start = time.time()
+        for _ in range(pargs.steps):
+            latent1, _ = func(z)
+        latent1.numpy()
+        elapsed = time.time() - time_start
+        print('{:20s} {:8.3f} ms/step'.format(name, 1000 * elapsed / pargs.steps))
@@ -0,0 +1,43 @@
+"""Measure training images/s per lod phase with and without native resolution.
+
+Uses the synthetic dataset, so no dataset files are needed.
+
+Run from the repository root:
+    python -m benchmark.native_resolution --res 256 --steps 20
+"""
+import argparse
+import time
+from benchmark.common import synthetic_params
+from src.model.stylegan.executor import StyleGAN
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--res', type=int, default=None)
+parser.add_argument('--steps', type=int, default=20)
+parser.add_argument('--mode', default='dynamic', choices=['dynamic', 'static'])
+pargs = parser.parse_args()
+
+if __name__ == '__main__':
+    for native_resolution in [False, True]:
+        p = synthetic_params(pargs.res, native_resolution=native_resolution)
+        G = StyleGAN(p, mode=pargs.mode)
+
+        for lod in range(G.get_maximum_lod() + 1):
+            lod_input = G.convert_lod(lod)
+            lod_phase = G.get_lod_phase(lod)
+            iterator_disc, iterator_gen = G.make_train_iterators(
+                G.get_images_at_lod(lod), lod_phase=lod_phase)
+
+            # The first steps trace the graphs of the phase.
+            G.model.train_disc(iterator_disc, lod_input, lod_phase=lod_phase)
+            G.model.train_gen(iterator_gen, lod_input, lod_phase=lod_phase)
+            time_start = time.time()
+            for _ in range(pargs.steps):
+                d_loss = G.model.train_disc(
+                    iterator_disc, lod_input, lod_phase=lod_phase)
+                g_loss = G.model.train_gen(
+                    iterator_gen, lod_input, lod_phase=lod_phase)
+            float(d_loss), float(g_loss)
+            elapsed = time.time() - time_start
+            print('native {:5s} lod {:d} ({:4d}x{:<4d}) {:10.1f} images/s'.format(
+                str(native_resolution), lod, 2 ** (lod + 2), 2 ** (lod + 2),
+                pargs.steps * p.batch_size / elapsed))
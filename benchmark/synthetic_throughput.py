@@ -0,0 +1,41 @@
+"""Measure training steps/s on synthetic images, with and without input.
+
+'host' feeds the synthetic images through the tf.data pipeline like a real
+dataset and 'device' generates them inside the step, so the difference
+between both shows how input-bound training is. No dataset files are needed.
+
+Run from the repository root:
+    python -m benchmark.synthetic_throughput --res 64 --lod 4
+"""
+import argparse
+import time
+from benchmark.common import synthetic_params
+from src.model.stylegan.executor import StyleGAN
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--res', type=int, default=None)
+parser.add_argument('--lod', type=float, default=None)
+parser.add_argument('--steps', type=int, default=50)
+parser.add_argument('--mode', default='dynamic', choices=['dynamic', 'static'])
+pargs = parser.parse_args()
+
+if __name__ == '__main__':
+    for device_dataset in [False, True]:
+        p = synthetic_params(pargs.res, device_dataset=device_dataset)
+        G = StyleGAN(p, mode=pargs.mode)
+        lod = G.get_maximum_lod() if pargs.lod is None else pargs.lod
+        lod_input = G.convert_lod(lod)
+        iterator_disc, iterator_gen = G.make_train_iterators(
+            G.get_images_at_lod(lod))
+
+        # The first steps trace the graphs.
+        G.model.train_disc(iterator_disc, lod_input)
+        G.model.train_gen(iterator_gen, lod_input)
+        time_start = time.time()
+        for _ in range(pargs.steps):
+            d_loss = G.model.train_disc(iterator_disc, lod_input)
+            g_loss = G.model.train_gen(iterator_gen, lod_input)
+        float(d_loss), float(g_loss)
+        elapsed = time.time() - time_start
+        print('{:8s} {:8.2f} steps/s'.format(
+            'device' if device_dataset else 'host', pargs.steps / elapsed))
@@ -0,0 +1,30 @@
+import argparse
+from params import Params
+from src.utils.dataset_utils import build_dataset_cache
+
+parser = argparse.ArgumentParser()
+parser.add_argument('datasets', nargs='*')
+parser.add_argument('--cache_dir', default=None)
+parser.add_argument('--num_workers', type=int, default=None)
+parser.add_argument('--resize_method', default=None)
+pargs = parser.parse_args()
+
+if __name__ == '__main__':
+    p = Params()
+    cache_dir = p.dataset_cache_dir if pargs.cache_dir is None else pargs.cache_dir
+    if cache_dir is None:
+        raise ValueError('Specify --cache_dir or Params.dataset_cache_dir.')
+    num_workers = p.dataset_num_workers if pargs.num_workers is None else pargs.num_workers
+    resize_method = p.dataset_resize_method \
+        if pargs.resize_method is None else pargs.resize_method
+
+    datasets = pargs.datasets
+    if len(datasets) == 0:
+        datasets = [p.dataset_train]
+        if p.dataset_eval is not None and p.dataset_eval != p.dataset_train:
+            datasets.append(p.dataset_eval)
+    for dataset_name in datasets:
+        print('Build cache of ' + dataset_name + '...')
+        build_dataset_cache(
+            dataset_name, cache_dir, num_workers=num_workers,
+            resize_method=resize_method)
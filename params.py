@@ -4,6 +4,9 @@ class Params(object):
         self.image_shape = (32, 32, 3)
 
         self.batch_size = 64 # バッチサイズ
+        self.batch_size_schedule = None # lodの段階ごとのバッチサイズ {lod: batch_size} (lod以下で最大のキーを使う), 'auto'でメモリに収まる最大を探索する
+        self.batch_size_auto_max = 1024 # 'auto'で探索するバッチサイズの上限
+        self.batch_size_memory_budget = None # 'auto'で使うGPUメモリの上限 (バイト, None: メモリ不足になるまで)
 
         self.start_epoch = 0
         self.epochs = 100 # 学習回数
@@ -15,9 +18,25 @@ class Params(object):
         self.lr_beta2 = 0.99
 
         self.gp_weight = 10.0
+        self.r1_interval = 1 # R1ペナルティをDのこのステップ数ごとに別の学習ステップで計算する (lazy regularization)
+        self.disc_single_pass = False # Dの損失で実画像と生成画像を結合して1回で識別する
+        self.mixed_precision = None # 混合精度学習 (None, 'float16', 'bfloat16'). float16は動的loss scalingを使う
+        self.num_accumulation = 1 # train_disc, train_genでバッチをこの数のマイクロバッチに分けて勾配を累積する
+        self.recompute_res = None # この解像度以上のブロックは逆伝播で活性を再計算してメモリを節約する (Noneで無効)
 
         self.dataset_train = 'cifar10'
         self.dataset_eval = 'cifar10'
+        self.dataset_num_workers = None # 画像読み込みのプロセス数 (None: 全コア)
+        self.dataset_cache_dir = None # 前処理済みデータセットの保存先 (None: キャッシュしない)
+        self.dataset_resize_method = 'bicubic' # 'bicubic', 'box' or 'reduce'
+        self.dataset_shared_dir = None # 複数プロセスでデータセットを共有するディレクトリ (例: '/dev/shm/stylegan')
+        self.dataset_shard = None # (worker_index, num_workers): 各ワーカーが読み込むデータセットの分割
+        self.dataset_pyramid = False # 各解像度の縮小画像を事前に作成し, lodに応じた解像度で入力する
+        self.dataset_sampler = 'shuffle' # 'shuffle': 完全にシャッフル, 'block': ブロック単位で連続読み込み
+        self.dataset_block_size = 256 # 'block'で1回に連続して読み込む画像数
+        self.dataset_shuffle_buffer = 4096 # 'block'でシャッフルするバッファの画像数
+        self.device_dataset = False # 学習データをデバイスのメモリに置く
+        self.device_dataset_max_bytes = 2 ** 30 # device_datasetの上限 (超える場合は無効)
 
         #=======================================================================
         # Style GAN params
@@ -30,6 +49,12 @@ class Params(object):
         self.truncation_psi = 0.7
         self.truncation_cutoff = 4
         self.distribution = 'untruncated_normal'
+        self.specialize_lod_phases = False # staticモードでlodのフェーズごとに必要なブロックだけのグラフを作る
+        self.fused_train_step = False # DとGの更新を1回の呼び出しで行う
+        self.steps_per_execution = 1 # 1回の呼び出しでtf.rangeのループにより実行する学習ステップ数
+        self.native_resolution = False # 生成画像, 実画像, Discriminatorの入力を現在のlodの解像度のまま扱う
+        self.noise_in_graph = False # ノイズ入力をグラフ内で生成する
+        self.noise_seed = None # noise_in_graphの乱数シード (None: ランダム)
 
         self.epochs_at_lod_period = 10
         self.epochs_for_progressive = 10
@@ -0,0 +1,136 @@
+import os
+import time
+import zipfile
+import tarfile
+import numpy as np
+from PIL import Image
+from . import flickr_face
+from ..utils import parallel_reader
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz')
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+def is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+def list_images(path):
+    """Return the sorted names of the images in a directory or an archive.
+
+    The names are relative to `path` and use '/' as separator.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError("No such file or directory: '" + path + "'")
+    if path.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as f:
+            names = f.namelist()
+    elif is_archive(path):
+        with tarfile.open(path) as f:
+            names = [m.name for m in f.getmembers() if m.isfile()]
+    else:
+        names = []
+        for root, _, filenames in os.walk(path):
+            rel = os.path.relpath(root, path)
+            for filename in filenames:
+                name = filename if rel == '.' else os.path.join(rel, filename)
+                names.append(name.replace(os.sep, '/'))
+    return sorted(name for name in names if is_image(name))
+
+def get_labels(names):
+    """Return class labels from the first directory of the names, or None.
+
+    Images directly in the root of the folder have no label.
+    """
+    if not all('/' in name for name in names):
+        return None
+    classes = sorted(set(name.split('/')[0] for name in names))
+    class_ids = {c: i for i, c in enumerate(classes)}
+    return np.array([class_ids[name.split('/')[0]] for name in names],
+                    dtype=np.int64)
+
+def get_shard(N, shard):
+    """Return the index range of `shard=(worker_index, num_workers)`."""
+    if shard is None:
+        return 0, N
+    worker_index, num_workers = shard
+    return N * worker_index // num_workers, N * (worker_index + 1) // num_workers
+
+def load_data(path, res, shard=None, num_workers=None, resize_method='bicubic'):
+    """Load the images of a folder or archive as (images, labels).
+
+    The images are center-cropped to squares and resized to `res` x `res`.
+    With `shard=(worker_index, num_workers)` only that contiguous slice of
+    the sorted images is decoded.
+    """
+    names = list_images(path)
+    labels = get_labels(names)
+    start, end = get_shard(len(names), shard)
+    names = names[start:end]
+    if labels is not None:
+        labels = labels[start:end]
+    images = read_images(path, names, res, num_workers=num_workers,
+                         resize_method=resize_method)
+    return images, labels
+
+def read_images(path, names, res, num_workers=None, out=None,
+                resize_method='bicubic'):
+    """Decode `names` of a folder or archive into an uint8 array.
+
+    The images are decoded by `parallel_reader.read_chunks` with
+    `num_workers` processes (default: all cores), each of which opens the
+    archive once. `out` is an optional preallocated array or `np.memmap`
+    of shape (N, res, res, 3).
+    """
+    if resize_method not in flickr_face.RESIZE_METHODS:
+        raise ValueError('Unknown resize method: ' + resize_method)
+    N = len(names)
+    if out is None:
+        out = np.zeros([N, res, res, 3], dtype=np.uint8)
+
+    time_start = time.time()
+    parallel_reader.read_chunks(
+        out, load_chunk, args=(names, res, resize_method),
+        initializer=open_source, initargs=(path,), num_workers=num_workers,
+        progress=lambda n: flickr_face.show_progress(
+            n, (0, N), time_start, title=path))
+    print()
+    return out
+
+def load_image(f, res, resize_method='bicubic'):
+    image_pil = Image.open(f).convert('RGB')
+    size = min(image_pil.width, image_pil.height)
+    if image_pil.width != image_pil.height:
+        left = (image_pil.width - size) // 2
+        top = (image_pil.height - size) // 2
+        image_pil = image_pil.crop((left, top, left + size, top + size))
+    factor = flickr_face.get_reduce_factor(size, res)
+    if resize_method == 'reduce' and factor > 1:
+        image_pil = image_pil.reduce(factor)
+    elif resize_method == 'box' and factor > 1:
+        image = flickr_face.box_downsample(np.array(image_pil)[np.newaxis], factor)
+        image_pil = Image.fromarray(image[0])
+    if image_pil.width != res:
+        image_pil = image_pil.resize((res, res), Image.BICUBIC)
+    return np.array(image_pil)
+
+_source = {}
+
+def open_source(path):
+    """Open the folder or archive `path` for `load_chunk` in this process."""
+    if path.lower().endswith('.zip'):
+        _source['archive'] = zipfile.ZipFile(path)
+        _source['open'] = _source['archive'].open
+    elif is_archive(path):
+        _source['archive'] = tarfile.open(path)
+        _source['open'] = _source['archive'].extractfile
+    else:
+        _source['open'] = lambda name: open(os.path.join(path, name), 'rb')
+
+def load_chunk(chunk, names, res, resize_method='bicubic'):
+    x = np.zeros([chunk[1] - chunk[0], res, res, 3], dtype=np.uint8)
+    for i in range(*chunk):
+        with _source['open'](names[i]) as f:
+            x[i - chunk[0]] = load_image(f, res, resize_method)
+    return x
@@ -0,0 +1,126 @@
+import numpy as np
+import tensorflow as tf
+
+# Synthetic images are a pure function of (seed, index): per-image colors and
+# stripe frequencies plus per-pixel noise, all drawn from an integer hash.
+# Only integer operations are used, so NumPy and TensorFlow give the same
+# images and the images can be generated on the device.
+
+NUM_TRAIN = 50000
+NUM_TEST = 10000
+
+MASK = 0xFFFFFFFF
+
+_numpy_ops = (np.bitwise_xor, np.right_shift, np.bitwise_and)
+_tf_ops = (tf.bitwise.bitwise_xor, tf.bitwise.right_shift, tf.bitwise.bitwise_and)
+
+def hash32(x, ops):
+    """32-bit integer hash of the int64 values `x` (lowbias32)."""
+    xor, shift, mask = ops
+    x = xor(x, shift(x, 16))
+    x = mask(x * 0x7feb352d, MASK)
+    x = xor(x, shift(x, 15))
+    x = mask(x * 0x846ca68b, MASK)
+    return xor(x, shift(x, 16))
+
+def hash_values(ops, index, *values):
+    """Hash `index` combined with `values` (ints or broadcastable arrays)."""
+    h = hash32(index, ops)
+    for v in values:
+        h = hash32(ops[0](h, v), ops)
+    return h
+
+def generate(indices, shape, seed=0, ops=_numpy_ops):
+    """Return the uint8 images of `indices` as int64 values in [0, 255].
+
+    `indices` is an int64 array or tensor of shape [N].
+    """
+    if ops is _numpy_ops:
+        reshape = np.reshape
+        arange = lambda n: np.arange(n, dtype=np.int64)
+    else:
+        reshape = tf.reshape
+        arange = lambda n: tf.range(n, dtype=tf.int64)
+    rows, cols, ch = shape
+    index = reshape(indices, [-1, 1, 1, 1])
+    y = reshape(arange(rows), [1, -1, 1, 1])
+    x = reshape(arange(cols), [1, 1, -1, 1])
+    c = reshape(arange(ch), [1, 1, 1, -1])
+
+    fy = hash_values(ops, index, seed, 0) % 8
+    fx = hash_values(ops, index, seed, 1) % 8
+    base = hash_values(ops, index, seed, 2 + c) % 256
+    noise = hash_values(ops, index, seed, 2 + ch + (y * cols + x) * ch + c) % 32
+    return (base + y * fy * 256 // rows + x * fx * 256 // cols + noise) % 256
+
+def generate_numpy(indices, shape, seed=0):
+    indices = np.asarray(indices, dtype=np.int64)
+    return generate(indices, shape, seed).astype(np.uint8)
+
+def generate_tf(indices, shape, seed=0):
+    indices = tf.cast(indices, tf.int64)
+    return tf.cast(generate(indices, shape, seed, ops=_tf_ops), tf.uint8)
+
+class SyntheticImages(object):
+    """Lazy uint8 array of synthetic images.
+
+    Indexing with an integer or an index array generates the images, while
+    a slice returns another lazy `SyntheticImages`, so sharding and block
+    reads never generate more than needed. `generate_tf` generates a batch
+    in graph.
+    """
+
+    def __init__(self, num_examples, shape, seed=0, offset=0):
+        self.num_examples = num_examples
+        self.image_shape = tuple(shape)
+        self.seed = seed
+        self.offset = offset
+
+    @property
+    def shape(self):
+        return (self.num_examples,) + self.image_shape
+
+    @property
+    def dtype(self):
+        return np.dtype(np.uint8)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.num_examples
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.num_examples)
+            if step == 1:
+                return SyntheticImages(
+                    max(stop - start, 0), self.image_shape, self.seed,
+                    self.offset + start)
+            key = np.arange(start, stop, step)
+        indices = np.arange(self.num_examples)[key]
+        images = generate_numpy(
+            np.reshape(indices, [-1]) + self.offset, self.image_shape, self.seed)
+        return images.reshape(np.shape(indices) + self.image_shape)
+
+    def __array__(self, dtype=None):
+        images = self[np.arange(self.num_examples)]
+        return images if dtype is None else images.astype(dtype)
+
+    def astype(self, dtype):
+        return np.asarray(self).astype(dtype)
+
+    def generate_tf(self, indices):
+        """Return the images of `indices` as an uint8 tensor."""
+        return generate_tf(indices + self.offset, self.image_shape, self.seed)
+
+def load_data(image_shape, num_train=NUM_TRAIN, num_test=NUM_TEST, seed=0):
+    """Return the train and test splits as lazy arrays without labels."""
+    x_train = SyntheticImages(num_train, image_shape, seed)
+    x_test = SyntheticImages(num_test, image_shape, seed, offset=num_train)
+    return (x_train, None), (x_test, None)
@@ -0,0 +1,30 @@
+import numpy as np
+import tensorflow as tf
+from src.dataset import synthetic
+
+def test_numpy_tf_parity():
+    images = synthetic.SyntheticImages(100, (16, 16, 3), seed=3, offset=20)
+    indices = np.array([0, 7, 42, 99], dtype=np.int64)
+    x_numpy = images[indices]
+    x_tf = images.generate_tf(tf.constant(indices)).numpy()
+    assert x_numpy.dtype == x_tf.dtype == np.uint8
+    np.testing.assert_array_equal(x_numpy, x_tf)
+
+def test_slice_parity():
+    images = synthetic.SyntheticImages(100, (8, 8, 3), seed=1)
+    np.testing.assert_array_equal(np.asarray(images[10:20]), images[np.arange(10, 20)])
+
+def test_image_shape():
+    """Non-square and single channel images match as well."""
+    images = synthetic.SyntheticImages(10, (8, 16, 1), seed=2)
+    indices = np.arange(10, dtype=np.int64)
+    x_numpy = images[indices]
+    assert x_numpy.shape == (10, 8, 16, 1)
+    np.testing.assert_array_equal(
+        x_numpy, images.generate_tf(tf.constant(indices)).numpy())
+
+if __name__ == '__main__':
+    test_numpy_tf_parity()
+    test_slice_parity()
+    test_image_shape()
+    print('ok')
@@ -1,3 +1,4 @@
+from tensorflow.python.framework import dtypes
 from tensorflow.python.keras.engine.base_layer import Layer
 
 from tensorflow.python.ops import array_ops
@@ -9,9 +10,10 @@ class PixelNormalization(Layer):
         self.epsilon = epsilon
 
     def call(self, inputs):
-        var = math_ops.reduce_mean(
-            math_ops.square(inputs), axis=-1, keepdims=True)
-        return inputs * math_ops.rsqrt(var + self.epsilon)
+        # The mean square is computed in float32 for mixed precision.
+        x = math_ops.cast(inputs, dtypes.float32)
+        var = math_ops.reduce_mean(math_ops.square(x), axis=-1, keepdims=True)
+        return inputs * math_ops.cast(math_ops.rsqrt(var + self.epsilon), inputs.dtype)
 
 
 class BatchStddev(Layer):
@@ -24,17 +26,24 @@ class BatchStddev(Layer):
         self.shape = input_shape
         self.build =True
 
-    def call(self, inputs):
+    def call(self, inputs, num_splits=1):
+        # With num_splits > 1 the statistics are computed separately for
+        # num_splits equal consecutive parts of the batch.
+        group_size = self.group_size
         if inputs.shape[0] is not None:
-            self.group_size = min(self.group_size, inputs.shape[0])
-        shape = (self.group_size, -1, self.shape[1], self.shape[2],
+            group_size = min(group_size, inputs.shape[0] // num_splits)
+        shape = (num_splits, group_size, -1, self.shape[1], self.shape[2],
             self.shape[3] // self.num_features, self.num_features)
-        x = array_ops.reshape(inputs, shape)
-        x -= math_ops.reduce_mean(x, axis=0, keepdims=True)
-        x = math_ops.reduce_mean(math_ops.square(x), axis=0)
+        # The statistics are computed in float32 for mixed precision.
+        x = array_ops.reshape(math_ops.cast(inputs, dtypes.float32), shape)
+        x -= math_ops.reduce_mean(x, axis=1, keepdims=True)
+        x = math_ops.reduce_mean(math_ops.square(x), axis=1)
         x = math_ops.sqrt(x)
-        x = math_ops.reduce_mean(x, axis=[1, 2], keepdims=True)
-        x = math_ops.reduce_mean(x, axis=3)
+        x = math_ops.reduce_mean(x, axis=[2, 3], keepdims=True)
+        x = math_ops.reduce_mean(x, axis=4)
         x = array_ops.tile(
-            x, (self.group_size, self.shape[1], self.shape[2], 1))
+            x, (1, group_size, self.shape[1], self.shape[2], 1))
+        x = array_ops.reshape(
+            x, (-1, self.shape[1], self.shape[2], self.num_features))
+        x = math_ops.cast(x, inputs.dtype)
         return array_ops.concat([inputs, x], axis=-1)
@@ -1,3 +1,4 @@
+from tensorflow.python.framework import dtypes
 from tensorflow.python.keras import backend as K
 from tensorflow.python.keras import initializers
 from tensorflow.python.keras import regularizers
@@ -162,12 +163,14 @@ class AdaIN(Layer):
         self.build =True
 
     def _instance_normalize(self, x):
+        # Normalize in float32, as epsilon underflows in float16.
         x_dtype = x.dtype
+        x = math_ops.cast(x, dtypes.float32)
         x -= math_ops.reduce_mean(x, axis=[1, 2], keepdims=True)
-        epsilon = K.constant(self.epsilon, dtype=x_dtype, name='epsilon')
+        epsilon = K.constant(self.epsilon, dtype=dtypes.float32, name='epsilon')
         x *= math_ops.rsqrt(
             math_ops.reduce_mean(x ** 2, axis=[1, 2], keepdims=True) + epsilon)
-        return x
+        return math_ops.cast(x, x_dtype)
 
     def call(self, inputs):
         if not isinstance(inputs, list) and not isinstance(inputs, tuple):
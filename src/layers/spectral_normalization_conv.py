@@ -10,6 +10,7 @@ from operator import mul
 
 from tensorflow.python.distribute import distribution_strategy_context
 
+from tensorflow.python.framework import dtypes
 from tensorflow.python.framework import ops
 from tensorflow.python.framework import tensor_shape
 
@@ -136,6 +137,11 @@ class SNConv(Conv):
         self.lr_mul = lr_mul
         self.singular_vector_initializer = singular_vector_initializer
         self.power_iter = power_iter
+        # If True, `call` reuses the sigma of the previous call and does not
+        # update the singular vector, e.g. when a forward pass is recomputed
+        # for the gradients (`tf.recompute_grad`).
+        self.reuse_sigma = False
+        self.sigma = None
         self._trainable_var = None
         self.trainable = trainable
 
@@ -159,7 +165,7 @@ class SNConv(Conv):
         super(SNConv, self).build(input_shape)
         if self.use_wscale:
             fan_in = reduce(mul, self.kernel_size) * int(input_shape[-1])
-            self.coeff = np.sqrt(2 / fan_in)
+            self.coeff = float(np.sqrt(2 / fan_in))
         else:
             self.coeff = 1.0
 
@@ -211,16 +217,34 @@ class SNConv(Conv):
                 return y, grad
             kernel = lr_multiplier(self.coeff * self.kernel)
 
+        if self.reuse_sigma:
+            W_bar = kernel / math_ops.cast(array_ops.squeeze(self.sigma), kernel.dtype)
+            return self._convolve(inputs, W_bar)
+
+        sigma_W = self._power_iteration(kernel, training)
+        self.sigma = sigma_W
+        W_bar = kernel / math_ops.cast(array_ops.squeeze(sigma_W), kernel.dtype)
+        return self._convolve(inputs, W_bar)
+
+    def update_singular_vector(self, training=None):
+        """Update the singular vector as `call` does, without convolving.
+
+        Keeps the power iteration of a skipped layer in step with a call.
+        """
+        self._power_iteration(self.coeff * self.kernel, training)
+
+    def _power_iteration(self, kernel, training=None):
         training = self._get_training_value(training)
 
-        # Update singular vector by power iteration
+        # Update singular vector by power iteration (in float32)
+        kernel_32 = math_ops.cast(kernel, dtypes.float32)
         if self.data_format == 'channels_first':
-            W_T = array_ops.reshape(kernel, (self.filters, -1))
+            W_T = array_ops.reshape(kernel_32, (self.filters, -1))
             W = array_ops.transpose(W_T)
         else:
-            W = array_ops.reshape(kernel, (-1, self.filters))
+            W = array_ops.reshape(kernel_32, (-1, self.filters))
             W_T = array_ops.transpose(W)
-        u = array_ops.identity(self.u)
+        u = math_ops.cast(self.u, dtypes.float32)
         for i in range(self.power_iter):
             v = nn_impl.l2_normalize(math_ops.matmul(u, W))  # 1 x filters
             u = nn_impl.l2_normalize(math_ops.matmul(v, W_T))
@@ -228,7 +252,6 @@ class SNConv(Conv):
         sigma_W = math_ops.matmul(math_ops.matmul(u, W), array_ops.transpose(v))
         # Backprop doesn't need in power iteration
         sigma_W = array_ops.stop_gradient(sigma_W)
-        W_bar = kernel / array_ops.squeeze(sigma_W)
 
         # Assign new singular vector
         training_value = tf_utils.constant_value(training)
@@ -240,7 +263,9 @@ class SNConv(Conv):
                     return self.u
                 return tf_utils.smart_cond(training, true_branch, false_branch)
             self.add_update(u_update)
+        return sigma_W
 
+    def _convolve(self, inputs, W_bar):
         # normal convolution using W_bar
         outputs = self._convolution_op(inputs, W_bar)
 
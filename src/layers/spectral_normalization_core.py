@@ -150,7 +150,7 @@ class SNDense(Dense):
     def build(self, input_shape):
         if self.use_wscale:
             fan_in = int(input_shape[-1])
-            self.coeff = np.sqrt(2 / fan_in)
+            self.coeff = float(np.sqrt(2 / fan_in))
         else:
             self.coeff = 1.0
 
@@ -203,17 +203,18 @@ class SNDense(Dense):
 
         training = self._get_training_value(training)
 
-        # Update singular vector by power iteration
-        W_T = array_ops.transpose(W)
-        u = array_ops.identity(self.u)
+        # Update singular vector by power iteration (in float32)
+        W_32 = math_ops.cast(W, dtypes.float32)
+        W_T = array_ops.transpose(W_32)
+        u = math_ops.cast(self.u, dtypes.float32)
         for i in range(self.power_iter):
-            v = nn_impl.l2_normalize(math_ops.matmul(u, W))  # 1 x filters
+            v = nn_impl.l2_normalize(math_ops.matmul(u, W_32))  # 1 x filters
             u = nn_impl.l2_normalize(math_ops.matmul(v, W_T))
         # Spectral Normalization
-        sigma_W = math_ops.matmul(math_ops.matmul(u, W), array_ops.transpose(v))
+        sigma_W = math_ops.matmul(math_ops.matmul(u, W_32), array_ops.transpose(v))
         # Backprop doesn't need in power iteration
         sigma_W = array_ops.stop_gradient(sigma_W)
-        W_bar = W / array_ops.squeeze(sigma_W)
+        W_bar = W / math_ops.cast(array_ops.squeeze(sigma_W), W.dtype)
 
         # Assign new singular vector
         training_value = tf_utils.constant_value(training)
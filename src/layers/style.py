@@ -88,13 +88,22 @@ class MixStyle(Layer):
     def _interpolate(self, x1, x2, ratio):
         return x1 + ratio * (x2 - x1)
 
-    def call(self, inputs, training=None):
+    def update_latent_avg_with(self, latent_mean):
+        """Move the latent average towards `latent_mean` as `call` does in
+        training, where it is the mean of the first latents of the batch.
+        """
+        if self.update_latent_avg:
+            latent_avg_new = self._interpolate(
+                latent_mean, self.latent_avg, self.latent_avg_beta)
+            self._assign_latent_avg(self.latent_avg, latent_avg_new)
+
+    def call(self, inputs, training=None, update_latent_avg=True):
         training = self._get_training_value(training)
         latent1, latent2, lod = inputs
 
         training_value = tf_utils.constant_value(training)
         latent_avg_new = math_ops.reduce_mean(latent1[:, 0], axis=0)
-        if training_value != False and self.update_latent_avg:
+        if training_value != False and self.update_latent_avg and update_latent_avg:
             latent_avg_new = self._interpolate(
                 latent_avg_new, self.latent_avg, self.latent_avg_beta)
 
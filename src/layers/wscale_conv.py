@@ -67,7 +67,7 @@ class ScaledConv(Conv):
                 fan_in = reduce(mul, self.kernel_size) * int(input_shape[1])
             else:
                 fan_in = reduce(mul, self.kernel_size) * int(input_shape[-1])
-            self.coeff = np.sqrt(2 / fan_in)
+            self.coeff = float(np.sqrt(2 / fan_in))
         else:
             self.coeff = 1.0
 
@@ -59,7 +59,7 @@ class ScaledDense(Dense):
         super(ScaledDense, self).build(input_shape)
         if self.use_wscale:
             fan_in = int(input_shape[-1])
-            self.coeff = np.sqrt(2 / fan_in)
+            self.coeff = float(np.sqrt(2 / fan_in))
         else:
             self.coeff = 1.0
 
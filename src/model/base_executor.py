@@ -20,12 +20,24 @@ class ExecutorBase(object):
 
         self.history = {'D loss': [], 'G loss': []}
 
-        self.dataset_train = dataset_utils.get_dataset(self.params.dataset_train)['train']
+        num_workers = getattr(self.params, 'dataset_num_workers', None)
+        cache_dir = getattr(self.params, 'dataset_cache_dir', None)
+        resize_method = getattr(self.params, 'dataset_resize_method', 'bicubic')
+        shared_dir = getattr(self.params, 'dataset_shared_dir', None)
+        shard = getattr(self.params, 'dataset_shard', None)
+        self.dataset_train = dataset_utils.get_dataset(
+            self.params.dataset_train, num_workers=num_workers,
+            cache_dir=cache_dir, resize_method=resize_method,
+            pyramid=getattr(self.params, 'dataset_pyramid', False),
+            shared_dir=shared_dir, shard=shard)['train']
         assert self.dataset_train['images'].shape[1:] == self.params.image_shape
         if self.params.dataset_eval is None:
             self.dataset_eval = None
         else:
-            self.dataset_eval = dataset_utils.get_dataset(self.params.dataset_eval)['test']
+            self.dataset_eval = dataset_utils.get_dataset(
+                self.params.dataset_eval, num_workers=num_workers,
+                cache_dir=cache_dir, resize_method=resize_method,
+                shared_dir=shared_dir, shard=shard)['test']
             assert self.dataset_eval['images'].shape[1:] == self.params.image_shape
 
     def _save(self, obj, filename):
@@ -2,10 +2,12 @@ import os
 import sys
 import time
 import numpy as np
+import tensorflow as tf
 from .network import res2num_blocks
 from .model import StyleGANModel
 from ..base_executor import ExecutorBase
-from ...utils import image_utils, utils
+from ...dataset import synthetic
+from ...utils import image_utils, input_pipeline, utils
 from ...utils.decorator import tpu_decorator
 
 class StyleGAN(ExecutorBase):
@@ -13,23 +15,67 @@ class StyleGAN(ExecutorBase):
         super().__init__(params, use_tpu=use_tpu, show_mode=show_mode)
         self.N_train = self.dataset_train['images'].shape[0]
         self.N_batches = self.N_train // self.params.batch_size
+        self.read_stats = input_pipeline.ReadStats()
+        # {lod phase: batch size}, see `get_batch_size`. 'auto' is probed
+        # after the model is built.
+        self.batch_size_schedule = getattr(self.params, 'batch_size_schedule', None)
+        probe_batch_size = self.batch_size_schedule == 'auto'
+        if probe_batch_size:
+            self.batch_size_schedule = None
+        elif self.batch_size_schedule:
+            # The keys of a Params loaded from JSON are strings.
+            self.batch_size_schedule = {
+                int(p): b for p, b in self.batch_size_schedule.items()}
+        self.lr_schedule_from_params = hasattr(self.params, 'lr_schedule')
         self.params.lr_schedule = self.get_lr_schedule()
 
         self.model = StyleGANModel(params, use_tpu=use_tpu, mode=mode)
         if self.use_tpu:
             self.strategy = self.model.strategy
-
-        print('number of batches:', self.N_batches)
+        if getattr(self.params, 'device_dataset', False):
+            self.set_device_dataset()
+        if self.model.device_dataset is None and \
+           getattr(self.params, 'dataset_sampler', 'shuffle') == 'block':
+            self.show_sampler_randomness()
+        if probe_batch_size:
+            self.set_auto_batch_size_schedule()
+
+        if self.batch_size_schedule:
+            for lod in range(self.get_maximum_lod() + 1):
+                print('lod {:d}: batch size {:d}, number of batches {:d}'.format(
+                    lod, self.get_batch_size(lod), self.get_num_batches(lod)))
+        else:
+            print('number of batches:', self.N_batches)
         print('Level of details range: 0.0 - {:.1f}'.format(self.get_maximum_lod()))
 
+    def get_batch_size(self, lod):
+        """Return the batch size of the phase `ceil(lod)`.
+
+        `params.batch_size_schedule` maps lod phases to batch sizes, and the
+        largest phase not above `ceil(lod)` applies. Phases before the first
+        one use `params.batch_size`.
+        """
+        if not self.batch_size_schedule:
+            return self.params.batch_size
+        phase = int(np.ceil(lod))
+        phases = [p for p in self.batch_size_schedule.keys() if p <= phase]
+        if not phases:
+            return self.params.batch_size
+        return self.batch_size_schedule[max(phases)]
+
+    def get_num_batches(self, lod):
+        """Return the number of iterations of an epoch at `lod`."""
+        return self.N_train // self.get_batch_size(lod)
+
     def get_lr_schedule(self):
-        if hasattr(self.params, 'lr_schedule'):
+        if self.lr_schedule_from_params:
             return self.params.lr_schedule
 
-        steps_at_lod_period = self.params.epochs_at_lod_period * self.N_batches
-        steps_for_progressive = self.params.epochs_for_progressive * self.N_batches
+        # The epochs of the phase `lod` take the steps of its batch size.
+        epochs_per_phase = self.params.epochs_at_lod_period + \
+                           self.params.epochs_for_progressive
 
-        steps = steps_at_lod_period
+        steps = self.params.epochs_at_lod_period * self.get_num_batches(0)
         boundaries = []
         values = [self.params.learning_rate * self.params.lr_mul_shedule[0]]
         for lod in range(1, self.get_maximum_lod() + 1):
@@ -40,8 +86,131 @@ class StyleGAN(ExecutorBase):
                     boundaries.append(steps)
                 values.append(
                     self.params.learning_rate * self.params.lr_mul_shedule[lod])
-            steps += steps_at_lod_period + steps_for_progressive
-        return {'boundaries': boundaries, 'values': values}
+            steps += epochs_per_phase * self.get_num_batches(lod)
+        return {'boundaries': [int(b) for b in boundaries], 'values': values}
+
+    def set_auto_batch_size_schedule(self):
+        """Probe the largest batch size of every lod phase.
+
+        For every phase the batch size is doubled from `params.batch_size`
+        up to `params.batch_size_auto_max` while the train steps of `fit`
+        do not run out of memory and, if `params.batch_size_memory_budget`
+        is given and TensorFlow reports it, their peak GPU memory stays
+        within the budget. The steps are traced anew from the train step
+        functions, so the traces of the model are not touched. Afterwards
+        the weights, the noise step and the device dataset are restored,
+        the optimizers are rebuilt with the learning rate schedule of the
+        new batch sizes and the NumPy random state is restored.
+        """
+        if self.use_tpu:
+            print('Warning! batch_size_schedule auto is not supported on TPU. '
+                  'Use batch_size for every lod.')
+            return
+        print('Probe batch sizes...')
+        random_state = np.random.get_state()
+        weights = self.model.get_weights()
+        device_dataset = self.model.device_dataset
+        if device_dataset is not None:
+            device_dataset_state = [device_dataset.index.numpy(),
+                                    device_dataset.position.numpy()]
+        steps = {name: tf.function(getattr(StyleGANModel, name).python_function)
+                 for name in ['train_step', 'train_disc', 'train_gen']}
+
+        max_batch_size = min(getattr(self.params, 'batch_size_auto_max', 1024),
+                             self.N_train)
+        schedule = {}
+        for lod in range(self.get_maximum_lod() + 1):
+            batch_size = self.params.batch_size
+            while not self.fits_memory(steps, batch_size, lod):
+                batch_size //= 2
+                if batch_size == 0 or \
+                   batch_size % self.model.num_accumulation != 0:
+                    raise ValueError(
+                        'No batch size of lod {:d} fits the memory.'.format(lod))
+            while batch_size * 2 <= max_batch_size and \
+                  self.fits_memory(steps, batch_size * 2, lod):
+                batch_size *= 2
+            schedule[lod] = batch_size
+        self.batch_size_schedule = schedule
+
+        if not self.lr_schedule_from_params:
+            self.params.lr_schedule = self.get_lr_schedule()
+        self.model.build_optimizers()
+        self.model.set_weights(weights, load_optimizer=False)
+        if device_dataset is not None:
+            device_dataset.index.assign(device_dataset_state[0])
+            device_dataset.position.assign(device_dataset_state[1])
+        self.model.set_batch_size(self.params.batch_size)
+        np.random.set_state(random_state)
+
+    def fits_memory(self, steps, batch_size, lod):
+        """Return whether the train steps at `lod` fit the memory.
+
+        Runs every step `fit` runs at `lod` once, by the functions `steps`
+        of `set_auto_batch_size_schedule`.
+        """
+        budget = getattr(self.params, 'batch_size_memory_budget', None)
+        measure = budget is not None and \
+            len(tf.config.list_physical_devices('GPU')) > 0 and \
+            hasattr(tf.config.experimental, 'get_memory_info') and \
+            hasattr(tf.config.experimental, 'reset_memory_stats')
+
+        try:
+            self.model.set_batch_size(batch_size)
+        except ValueError:
+            return False
+        lod_input = self.convert_lod(lod)
+        lod_phase = self.get_lod_phase(lod)
+        if self.model.device_dataset is None:
+            images = self.get_images_at_lod(lod)
+        else:
+            images = self.dataset_train['images']
+        iterator_disc, iterator_gen = self.make_train_iterators(
+            images, lod_phase=lod_phase, batch_size=batch_size)
+        fused_train_step, _ = self.get_train_mode()
+        regularize_flags = [False]
+        if self.model.is_lazy_regularization():
+            regularize_flags.append(True)
+
+        if measure:
+            tf.config.experimental.reset_memory_stats('GPU:0')
+        try:
+            for regularize in regularize_flags:
+                if fused_train_step:
+                    losses = steps['train_step'](
+                        self.model, iterator_disc, lod_input,
+                        lod_phase=lod_phase, regularize=regularize)
+                else:
+                    losses = (steps['train_disc'](
+                        self.model, iterator_disc, lod_input,
+                        lod_phase=lod_phase, regularize=regularize),
+                              steps['train_gen'](
+                        self.model, iterator_gen, lod_input,
+                        lod_phase=lod_phase))
+                [loss.numpy() for loss in losses]
+        except tf.errors.ResourceExhaustedError:
+            return False
+        if measure:
+            return tf.config.experimental.get_memory_info('GPU:0')['peak'] <= budget
+        return True
+
+    def get_train_mode(self):
+        """Return (fused_train_step, steps_per_execution) of `fit`."""
+        # Train D and G in one compiled call. It takes the inputs of
+        # `train_disc` and reuses its latents for the generator update.
+        fused_train_step = getattr(self.params, 'fused_train_step', False)
+        # Run up to this many steps in one compiled call (see `get_step_chunks`).
+        steps_per_execution = getattr(self.params, 'steps_per_execution', 1)
+        if steps_per_execution > 1 and not fused_train_step:
+            print('steps_per_execution > 1 runs the fused train step.')
+            fused_train_step = True
+        if self.model.num_accumulation > 1 and fused_train_step:
+            # Gradients are accumulated in `train_disc` and `train_gen` only.
+            print('Gradient accumulation runs train_disc and train_gen '
+                  'one step per call.')
+            fused_train_step = False
+            steps_per_execution = 1
+        return fused_train_step, steps_per_execution
 
     def save_weights(self, filename, epoch):
         obj = {'epoch': epoch,
@@ -66,6 +235,45 @@ class StyleGAN(ExecutorBase):
         res = self.params.image_shape[0]
         return utils.num_div2(res) - 2
 
+    def set_device_dataset(self):
+        """Keep the training images on the devices if they fit the budget.
+
+        Synthetic images are generated on the devices instead.
+        """
+        images = self.dataset_train['images']
+        if isinstance(images, synthetic.SyntheticImages):
+            self.model.set_device_dataset(images)
+            return
+        max_bytes = getattr(self.params, 'device_dataset_max_bytes', 2 ** 30)
+        if images.nbytes > max_bytes:
+            print(('Warning! Training images ({:.1f} MB) exceed '
+                   'device_dataset_max_bytes ({:.1f} MB). '
+                   'Use the input pipeline instead.').format(
+                       images.nbytes / 2 ** 20, max_bytes / 2 ** 20))
+            return
+        print('Upload training images to devices...')
+        self.model.set_device_dataset(np.asarray(images))
+
+    def show_sampler_randomness(self):
+        randomness = input_pipeline.block_shuffle_randomness(
+            self.N_train, self.params.batch_size,
+            block_size=getattr(self.params, 'dataset_block_size', 256),
+            buffer_size=getattr(self.params, 'dataset_shuffle_buffer', 4096))
+        print('Block sampler: distinct blocks per batch '
+              '{:.1f}% of a full shuffle'.format(100 * randomness))
+
+    def get_images_at_lod(self, lod):
+        """Return the training images with the resolution needed at `lod`.
+
+        This is the pyramid level of the current lod if the dataset has one,
+        otherwise the full resolution images.
+        """
+        res = 2 ** (int(np.ceil(lod)) + 2)
+        key = image_utils.get_pyramid_key(res)
+        if res < self.params.image_shape[0] and key in self.dataset_train:
+            return self.dataset_train[key]
+        return self.dataset_train['images']
+
     def get_z(self, N=None):
         if N is None:
             N = self.N_train
@@ -85,6 +293,82 @@ class StyleGAN(ExecutorBase):
             noises[i] = np.random.normal(0, 1, shape).astype(np.float32)
         return noises
 
+    def get_latents(self, N, num_blocks=None):
+        """Return (z, *noises) like `get_z` and `get_noises` as tensors.
+
+        Only the noises of the first `num_blocks` blocks are drawn if given.
+        If the model draws the noises in graph, only (z,) is returned.
+        """
+        if num_blocks is None:
+            num_blocks = res2num_blocks(self.params.image_shape[0])
+        z = tf.random.normal((N, self.params.z_dim))
+        if self.model.noise_in_graph:
+            return (z,)
+        noises = [tf.random.normal((N, 2 ** (i + 2), 2 ** (i + 2), 2))
+                  for i in range(num_blocks)]
+        return (z, *noises)
+
+    def get_lod_phase(self, lod):
+        """Return the integer phase of `lod` for the train steps, or None.
+
+        The steps get a phase with `params.native_resolution`, and in static
+        mode with `params.specialize_lod_phases`. Then one step is compiled
+        per phase, containing only the blocks of that phase. In static mode
+        the outputs and the spectral normalization are the same as running
+        every block, since the blocks outside the phase are faded out
+        completely. Only the layers trained in an earlier phase and faded
+        out now are not moved by the momentum of Adam any more.
+        """
+        if getattr(self.params, 'native_resolution', False) or \
+           (self.model.mode == 'static' and
+            getattr(self.params, 'specialize_lod_phases', False)):
+            return int(np.ceil(lod))
+        return None
+
+    def make_iterator(self, dataset):
+        if self.use_tpu:
+            dataset = self.strategy.experimental_distribute_dataset(dataset)
+        return iter(dataset)
+
+    def make_train_iterators(self, images, lod_phase=None, batch_size=None):
+        """Return the iterators over the inputs of `train_disc` and `train_gen`.
+
+        The iterators are endless, so they can be kept over epochs.
+        With `lod_phase`, only the noises of the blocks of that phase
+        are drawn.
+        `train_disc` gets (z, images, *noises) and `train_gen` (z, *noises).
+        The images stay uint8 and are converted to float in the model.
+        With a device dataset, `train_disc` gets (z, *noises) as well.
+        `params.dataset_sampler` selects a full shuffle ('shuffle') or the
+        block-shuffled sampler ('block') for memory-mapped datasets.
+        The block sampler reads in this process, so it is not used on TPU.
+        `batch_size` defaults to `params.batch_size`.
+        """
+        if batch_size is None:
+            batch_size = self.params.batch_size
+        num_blocks = None if lod_phase is None else lod_phase + 1
+        dataset_latents = input_pipeline.make_random_dataset(
+            lambda: self.get_latents(batch_size, num_blocks=num_blocks))
+        if self.model.device_dataset is not None:
+            return self.make_iterator(dataset_latents), \
+                   self.make_iterator(dataset_latents)
+
+        if getattr(self.params, 'dataset_sampler', 'shuffle') == 'block' \
+           and not self.use_tpu:
+            dataset_images = input_pipeline.make_block_shuffled_dataset(
+                images, batch_size,
+                block_size=getattr(self.params, 'dataset_block_size', 256),
+                buffer_size=getattr(self.params, 'dataset_shuffle_buffer', 4096),
+                read_stats=self.read_stats)
+        else:
+            dataset_images = input_pipeline.make_image_dataset(
+                images, batch_size, in_graph=self.use_tpu,
+                read_stats=self.read_stats)
+        dataset_disc = tf.data.Dataset.zip((dataset_latents, dataset_images))
+        dataset_disc = dataset_disc.map(
+            lambda latents, images: (latents[0], images, *latents[1:]))
+        return self.make_iterator(dataset_disc), self.make_iterator(dataset_latents)
+
     def convert_lod(self, lod):
         if self.use_tpu:
             lod = np.array([lod], dtype=np.float32).repeat((8))
@@ -96,14 +380,14 @@ class StyleGAN(ExecutorBase):
         if mode is None:
             mode = self.show_mode
         z = self.get_z(self.params.batch_size)
-        noises = self.get_noises(self.params.batch_size)
-        images_uint8 = self.dataset_train['images'][:self.params.batch_size]
-        images = image_utils.convert_color_range(
-            images_uint8, input_range=(0, 255), output_range=(-1, 1))
+        noises = []
+        if not self.model.noise_in_graph:
+            noises = self.get_noises(self.params.batch_size)
 
         lod_input = self.convert_lod(lod)
-        inputs = utils.convert_to_tensor((z, images, *noises))
-        images_gen_raw = self.model.eval_gen(inputs, lod_input).numpy()
+        inputs = utils.convert_to_tensor((z, *noises))
+        images_gen_raw = self.model.eval_gen(
+            inputs, lod_input, lod_phase=self.get_lod_phase(lod)).numpy()
         images_gen = image_utils.convert_color_range(
             images_gen_raw, input_range=(-1, 1), output_range=(0, 1))
         image_utils.show_images(images_gen, epoch=epoch, mode=mode)
@@ -119,20 +403,52 @@ class StyleGAN(ExecutorBase):
             N = self.params.batch_size
 
         z = self.get_z(N)
-        noises = self.get_noises(N)
-        images_uint8 = self.dataset_train['images'][:N]
-        images = image_utils.convert_color_range(
-            images_uint8, input_range=(0, 255), output_range=(-1, 1))
+        noises = []
+        if not self.model.noise_in_graph:
+            noises = self.get_noises(N)
 
         lod_input = self.convert_lod(lod)
-        inputs = utils.convert_to_tensor((z, images, *noises))
-        images_gen_raw = self.model.eval_gen(inputs, lod_input).numpy()
+        inputs = utils.convert_to_tensor((z, *noises))
+        images_gen_raw = self.model.eval_gen(
+            inputs, lod_input, lod_phase=self.get_lod_phase(lod)).numpy()
         images_gen = image_utils.convert_color_range(
             images_gen_raw, input_range=(-1, 1), output_range=(0, 1))
         image_utils.show_images(images_gen, mode=mode)
         self.save_images(images_gen, 'eval_image.png')
 
 
+    def get_step_chunks(self, iter_ratio, steps_per_execution=1, num_batches=None,
+                        disc_steps=0):
+        """Split the iterations of an epoch into chunks of one compiled call.
+
+        An epoch has `num_batches` iterations (default: `N_batches`).
+        Returns a list of (first iteration, number of steps, update_disc,
+        update_gen, regularize). Consecutive iterations share a chunk while they
+        update the same networks, up to `steps_per_execution` iterations.
+        With lazy regularization, every `r1_interval`-th D step, counted
+        after `disc_steps` earlier D steps, gets `regularize` and a chunk of
+        its own, so it applies the R1 penalty to its own real images.
+        """
+        if num_batches is None:
+            num_batches = self.N_batches
+        lazy_regularization = self.model.is_lazy_regularization()
+        chunks = []
+        for iteration in range(num_batches):
+            update_disc = iteration % iter_ratio[0] == 0
+            regularize = False
+            if update_disc:
+                disc_steps += 1
+                regularize = lazy_regularization and \
+                    disc_steps % self.model.r1_interval == 0
+            flags = (update_disc, iteration % iter_ratio[1] == 0, regularize)
+            if chunks and chunks[-1][2:] == flags and not regularize \
+               and chunks[-1][1] < steps_per_execution:
+                first, num_steps = chunks[-1][:2]
+                chunks[-1] = (first, num_steps + 1) + flags
+            else:
+                chunks.append((iteration, 1) + flags)
+        return chunks
+
     @tpu_decorator
     def fit(self,
             iter_ratio=(1, 1),
@@ -162,10 +478,14 @@ class StyleGAN(ExecutorBase):
 
         self.show_sample_images(lod=lod[0], epoch=self.params.start_epoch)
 
-        indices = np.arange(self.N_train)
+        iterator_key = None
+        fused_train_step, steps_per_execution = self.get_train_mode()
+        # Number of D steps, which schedules the lazy R1 regularization.
+        disc_steps = 0
         end_epoch = self.params.start_epoch + epochs
         for epoch in range(self.params.start_epoch, end_epoch):
             time_start_epoch = time.time()
+            self.read_stats.reset()
             d_loss_epoch = 0
             g_loss_epoch = 0
 
@@ -189,31 +509,54 @@ class StyleGAN(ExecutorBase):
                     self.model.initialize_optimizer()
 
             lod_input = self.convert_lod(lod_epoch)
-            np.random.shuffle(indices)
-            for iteration in range(self.N_batches):
-                z = self.get_z(self.params.batch_size)
-                noises = self.get_noises(self.params.batch_size)
-                indices_epoch = \
-                    indices[iteration * self.params.batch_size:(iteration + 1) * self.params.batch_size]
-                images_batch_uint8 = self.dataset_train['images'][indices_epoch]
-                images = image_utils.convert_color_range(
-                    images_batch_uint8, input_range=(0, 255), output_range=(-1, 1))
-                inputs = utils.convert_to_tensor((z, images, *noises))
-
-                if iteration % iter_ratio[0] == 0:
-                    d_loss = self.model.train_disc(inputs, lod_input)
-                    self.history['D loss'].append(d_loss)
-                else:
-                    self.history['D loss'].append(None)
-
-                if iteration % iter_ratio[1] == 0:
-                    g_loss = self.model.train_gen(inputs, lod_input)
-                    self.history['G loss'].append(g_loss)
-                else:
-                    self.history['G loss'].append(None)
-
-                d_loss_epoch += d_loss
-                g_loss_epoch += g_loss
+            lod_phase = self.get_lod_phase(lod_epoch)
+            batch_size = self.get_batch_size(lod_epoch)
+            num_batches = self.get_num_batches(lod_epoch)
+            self.model.set_batch_size(batch_size)
+            if self.model.device_dataset is None:
+                images_lod = self.get_images_at_lod(lod_epoch)
+            else:
+                images_lod = self.dataset_train['images']
+            if iterator_key is None or iterator_key[0] is not images_lod \
+               or iterator_key[1:] != (lod_phase, batch_size):
+                iterator_key = (images_lod, lod_phase, batch_size)
+                iterator_disc, iterator_gen = self.make_train_iterators(
+                    images_lod, lod_phase=lod_phase, batch_size=batch_size)
+            for iteration, num_steps, update_disc, update_gen, regularize in \
+                    self.get_step_chunks(iter_ratio, steps_per_execution,
+                                         num_batches=num_batches,
+                                         disc_steps=disc_steps):
+                d_losses = [None] * num_steps
+                g_losses = [None] * num_steps
+                if fused_train_step and (update_disc or update_gen):
+                    d_loss_steps, g_loss_steps = self.model.train_step(
+                        iterator_disc, lod_input, lod_phase=lod_phase,
+                        update_disc=update_disc, update_gen=update_gen,
+                        regularize=regularize, num_steps=num_steps)
+                    if update_disc:
+                        d_losses = list(np.reshape(d_loss_steps, [-1]))
+                    if update_gen:
+                        g_losses = list(np.reshape(g_loss_steps, [-1]))
+                elif not fused_train_step:
+                    if update_disc:
+                        d_losses = [self.model.train_disc(
+                            iterator_disc, lod_input, lod_phase=lod_phase,
+                            regularize=regularize)]
+                    if update_gen:
+                        g_losses = [self.model.train_gen(
+                            iterator_gen, lod_input, lod_phase=lod_phase)]
+                if update_disc:
+                    disc_steps += num_steps
+                for d_loss_step, g_loss_step in zip(d_losses, g_losses):
+                    self.history['D loss'].append(d_loss_step)
+                    self.history['G loss'].append(g_loss_step)
+                    if d_loss_step is not None:
+                        d_loss = d_loss_step
+                    if g_loss_step is not None:
+                        g_loss = g_loss_step
+                    d_loss_epoch += d_loss
+                    g_loss_epoch += g_loss
+                iteration += num_steps - 1
                 sys.stdout.write(
                     ('\repoch:{:d}  iter:{:d}  lod:{:.2f}  '
                      '[D loss: {:f}] [G loss: {:f}]   ').format(
@@ -221,14 +564,16 @@ class StyleGAN(ExecutorBase):
                         d_loss, g_loss))
                 sys.stdout.flush()
 
-            d_loss_epoch /= self.N_batches
-            g_loss_epoch /= self.N_batches
+            d_loss_epoch /= num_batches
+            g_loss_epoch /= num_batches
             epoch_time = time.time() - time_start_epoch
             sys.stdout.write(
                 ('\repoch:{:d}  iter:{:d}  lod:{:.2f}  '
-                 '[D loss: {:f}] [G loss: {:f}]   time: {:f}\n').format(
+                 '[D loss: {:f}] [G loss: {:f}]   time: {:f}  '
+                 'read: {:.1f} MB/s\n').format(
                     epoch + 1, iteration + 1, lod_epoch,
-                    d_loss_epoch, g_loss_epoch, epoch_time))
+                    d_loss_epoch, g_loss_epoch, epoch_time,
+                    self.read_stats.get_throughput()))
             sys.stdout.flush()
 
             if (epoch + 1) % show_sample_period == 0:
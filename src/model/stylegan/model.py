@@ -2,9 +2,22 @@ import numpy as np
 import tensorflow as tf
 from .network import GeneratorMapping, GeneratorSynthesis, \
                      Discriminator, StyleMixer, res2num_blocks, \
-                     image_resizer
+                     image_resizer, image_resizer_native, upsample_nearest
 from ..base_model import BaseModel
-from ...utils.decorator import tpu_decorator, tpu_ops_decorator, convert_to_tfdata_single_batch
+from ...utils.decorator import tpu_decorator, tpu_ops_decorator, \
+                               convert_to_tfdata_single_batch, \
+                               get_next_from_iterator, insert_device_batch, \
+                               insert_noise_seed, repeat_steps
+from ...utils.device_dataset import DeviceDataset, SyntheticDeviceDataset
+from ...dataset.synthetic import SyntheticImages
+
+LossScaleOptimizer = tf.keras.mixed_precision.experimental.LossScaleOptimizer
+
+def convert_images(images):
+    """Convert uint8 images to float32 in the range [-1, 1]."""
+    if images.dtype == tf.uint8:
+        images = tf.cast(images, tf.float32) / 127.5 - 1.0
+    return images
 
 class StyleGANModel(BaseModel):
     def __init__(self, params, use_tpu=False, mode=None):
@@ -28,6 +41,25 @@ class StyleGANModel(BaseModel):
         self.batch_std_num_features = getattr(params, 'batch_std_num_features', 1)
 
         self.use_sn_in_disc = getattr(params, 'use_sn_in_disc', False)
+        # Apply the R1 gradient penalty only every `r1_interval` D steps, in
+        # an extra optimizer step on the real images of that D step (lazy
+        # regularization). 1 applies it in the loss of every step.
+        self.r1_interval = getattr(params, 'r1_interval', 1)
+        # If True, D runs once on the concatenated real and fake images.
+        self.disc_single_pass = getattr(params, 'disc_single_pass', False)
+        # `train_disc` and `train_gen` split the batch into this many
+        # micro-batches and apply their averaged gradients once.
+        self.num_accumulation = getattr(params, 'num_accumulation', 1)
+        # Blocks of this resolution and above recompute their activations
+        # in the backward pass instead of storing them. None stores all.
+        self.recompute_res = getattr(params, 'recompute_res', None)
+        self.set_batch_size(self.params.batch_size)
+
+        # If True, train steps get no noise inputs and draw them in graph.
+        self.noise_in_graph = getattr(params, 'noise_in_graph', False)
+        self.noise_seed = getattr(params, 'noise_seed', None)
+        if self.noise_seed is None:
+            self.noise_seed = np.random.randint(2 ** 31 - 1)
 
         if self.use_tpu:
             if mode != 'static':
@@ -37,18 +69,40 @@ class StyleGANModel(BaseModel):
         else:
             self.mode = 'dynamic' if mode is None else mode
 
+        # 'float16' or 'bfloat16' computes in that type with float32
+        # variables. float16 uses dynamic loss scaling. The policy is global,
+        # so every model sets it.
+        self.mixed_precision = getattr(params, 'mixed_precision', None)
+        if self.mixed_precision is not None:
+            if self.mixed_precision not in ['float16', 'bfloat16']:
+                raise ValueError('Unknown mixed precision: ' + self.mixed_precision)
+            tf.keras.mixed_precision.experimental.set_policy(
+                'mixed_' + self.mixed_precision)
+        else:
+            tf.keras.mixed_precision.experimental.set_policy('float32')
+
+        self.device_dataset = None
         self.build_model()
 
-    def get_learning_rate(self):
+    def get_learning_rate(self, lr_ratio=1.0, step_ratio=1.0):
+        """Return the learning rate (schedule).
+
+        The rates are multiplied by `lr_ratio` and the boundaries of the
+        schedule by `step_ratio`.
+        """
         if hasattr(self.params, 'lr_schedule'):
             return tf.optimizers.schedules.PiecewiseConstantDecay(
-                self.params.lr_schedule['boundaries'],
-                self.params.lr_schedule['values'])
-        return self.params.learning_rate
+                [int(b * step_ratio) for b in self.params.lr_schedule['boundaries']],
+                [v * lr_ratio for v in self.params.lr_schedule['values']])
+        return self.params.learning_rate * lr_ratio
+
+    def is_lazy_regularization(self):
+        return self.r1_interval > 1 and self.params.gp_weight != 0.
 
     @tpu_decorator
     def build_model(self):
-
+        # The weights are saved by model name, so the names must not depend
+        # on the models built before in this process.
         print('build Discriminator...')
         self.discriminator = Discriminator(
             res=self.image_res,
@@ -61,10 +115,9 @@ class StyleGANModel(BaseModel):
             distribution=self.params.distribution,
             batch_std_group_size=self.batch_std_group_size,
             batch_std_num_features=self.batch_std_num_features,
-            use_sn=self.use_sn_in_disc)
-        self.optimizer_disc = tf.optimizers.Adam(
-            self.get_learning_rate(), self.params.lr_beta1, self.params.lr_beta2,
-            name='Adam_disc')
+            use_sn=self.use_sn_in_disc,
+            recompute_res=self.recompute_res,
+            name='discriminator')
 
         print('build Generator Synthesis...')
         self.generator_synthesis = GeneratorSynthesis(
@@ -76,7 +129,9 @@ class StyleGANModel(BaseModel):
             mode=self.mode,
             use_wscale=self.use_wscale,
             lr_mul=self.lr_mul['gen_synthesis'],
-            distribution=self.params.distribution)
+            distribution=self.params.distribution,
+            recompute_res=self.recompute_res,
+            name='generator_synthesis')
         print('build Generator Mapping...')
         self.generator_mapping = GeneratorMapping(
             res_out=self.image_res,
@@ -86,7 +141,8 @@ class StyleGANModel(BaseModel):
             num_output_latent=self.z_dim,
             use_wscale=self.use_wscale,
             lr_mul=self.lr_mul['gen_mapping'],
-            distribution=self.params.distribution)
+            distribution=self.params.distribution,
+            name='generator_mapping')
         print('build Generator Style Mixer...')
         self.generator_mix_style = StyleMixer(
             res_out=self.image_res,
@@ -94,93 +150,470 @@ class StyleGANModel(BaseModel):
             mixing_prob=self.mixing_prob,
             latent_avg_beta=self.latent_avg_beta,
             truncation_psi=self.truncation_psi,
-            truncation_cutoff=self.truncation_cutoff)
+            truncation_cutoff=self.truncation_cutoff,
+            dtype='float32',
+            name='style_mixer')
+
+        self.build_optimizers()
+        self.noise_step = tf.Variable(0, trainable=False, name='noise_step')
 
+    @tpu_decorator
+    def build_optimizers(self):
+        """Create the optimizers with the current `params.lr_schedule`."""
+        # With lazy regularization, D takes r1_interval + 1 optimizer steps
+        # per r1_interval iterations. As in StyleGAN2, the Adam parameters
+        # are scaled by c so that they match per iteration.
+        c = 1.0
+        if self.is_lazy_regularization():
+            c = self.r1_interval / (self.r1_interval + 1)
+        self.optimizer_disc = tf.optimizers.Adam(
+            self.get_learning_rate(lr_ratio=c, step_ratio=1 / c),
+            self.params.lr_beta1 ** c, self.params.lr_beta2 ** c,
+            name='Adam_disc')
         self.optimizer_gen = tf.optimizers.Adam(
             self.get_learning_rate(), self.params.lr_beta1, self.params.lr_beta2,
             name='Adam_gen')
+        self.create_optimizer_slots(
+            self.optimizer_disc, self.discriminator.trainable_variables)
+        self.create_optimizer_slots(
+            self.optimizer_gen, self.get_gen_trainable_variables())
+
+        # The optimizers the train steps apply the gradients with. They wrap
+        # the Adam optimizers above, which hold the state, with float16.
+        self.train_optimizer_disc = self.optimizer_disc
+        self.train_optimizer_gen = self.optimizer_gen
+        if self.mixed_precision == 'float16':
+            self.train_optimizer_disc = LossScaleOptimizer(self.optimizer_disc, 'dynamic')
+            self.train_optimizer_gen = LossScaleOptimizer(self.optimizer_gen, 'dynamic')
+
+    def create_optimizer_slots(self, optimizer, trainable_vars):
+        """Create the Adam slots of every variable up front.
+
+        In a lod phase the blocks after the phase get no gradients, so Adam
+        would create their slots only when they are first trained. Then
+        `get_weights` would miss them and `initialize_optimizer`, which is
+        traced once, would not reset them.
+        """
+        slot_names = ['m', 'v']
+        if optimizer.amsgrad:
+            slot_names.append('vhat')
+        for v in trainable_vars:
+            for slot_name in slot_names:
+                optimizer.add_slot(v, slot_name)
+
+    def set_batch_size(self, batch_size):
+        """Set the global batch size of the next train steps.
+
+        It changes the shapes of the inputs, so the steps are retraced.
+        """
+        # Every micro-batch takes whole minibatch standard deviation groups.
+        num_groups = batch_size // min(self.batch_std_group_size, batch_size)
+        if num_groups % self.num_accumulation != 0:
+            raise ValueError('batch_size / batch_std_group_size must be '
+                             'divisible by num_accumulation.')
+        self.batch_size = batch_size
+
+    def get_global_batch_size(self, x):
+        """Return the global batch size of the per-replica batch `x`.
+
+        The losses are normalized by it, so they follow the batch size
+        schedule and the micro-batches of `apply_accumulated_gradients`.
+        """
+        num_replicas = tf.distribute.get_replica_context().num_replicas_in_sync
+        return tf.cast(tf.shape(x)[0] * num_replicas, tf.float32)
 
-    @tf.function
-    @convert_to_tfdata_single_batch
-    @tpu_ops_decorator(mode='SUM')
-    def train_disc(self, inputs, lod):
-        z, images, *noises = inputs
-        z2 = tf.random.normal(tf.shape(z))
+    @tpu_decorator
+    def set_device_dataset(self, images):
+        """Upload the training images to the devices.
+
+        Then `train_disc` takes (z, *noises) and draws the real images
+        from the device. Synthetic images are generated on the device.
+        """
+        if isinstance(images, SyntheticImages):
+            self.device_dataset = SyntheticDeviceDataset(images)
+        else:
+            self.device_dataset = DeviceDataset(images)
+
+    def next_noise_seed(self):
+        """Return the seed of the noises of the next step.
+
+        Call this in cross-replica context. `get_replica_noise_seed` turns it
+        into a different seed for every replica.
+        """
+        self.noise_step.assign_add(1)
+        return tf.stack([self.noise_seed, self.noise_step.read_value()])
+
+    def get_replica_noise_seed(self, noise_seed):
+        if noise_seed is None:
+            return None
+        context = tf.distribute.get_replica_context()
+        return noise_seed * [1, context.num_replicas_in_sync] + \
+               [0, context.replica_id_in_sync_group]
+
+    def get_loss_scale(self, optimizer):
+        """Return the current loss scale of a `LossScaleOptimizer`."""
+        loss_scale = optimizer.loss_scale
+        return loss_scale() if callable(loss_scale) else loss_scale
+
+    def get_gradients(self, tape, loss, trainable_vars, optimizer):
+        """Return the gradients of `loss` recorded by `tape`.
+
+        With a `LossScaleOptimizer` the gradients are taken of the loss
+        scaled by its dynamic loss scale and then unscaled.
+        """
+        if isinstance(optimizer, LossScaleOptimizer):
+            grads = tape.gradient(
+                loss, trainable_vars, output_gradients=self.get_loss_scale(optimizer))
+            return optimizer.get_unscaled_gradients(grads)
+        return tape.gradient(loss, trainable_vars)
+
+    def apply_gradients(self, tape, loss, trainable_vars, optimizer):
+        """Apply the gradients of `loss` recorded by `tape` with `optimizer`."""
+        grads = self.get_gradients(tape, loss, trainable_vars, optimizer)
+        optimizer.apply_gradients(zip(grads, trainable_vars))
+
+    def apply_accumulated_gradients(self, micro_step, inputs, noise_seed,
+                                    trainable_vars, optimizer):
+        """Apply the gradients averaged over `num_accumulation` micro-batches.
+
+        `inputs`, a list of batched tensors, are split into micro-batches of
+        whole minibatch standard deviation groups of the full batch, which
+        `BatchStddev` forms of the elements strided by `batch / group_size`.
+        `micro_step(inputs, noise_seed)` processes them one
+        after another in a `tf.range` loop, so only the activations of one
+        micro-batch are alive at a time. It returns the gradients, the loss
+        normalized by the micro-batch size and the mean of the first latents,
+        or None if the latent average is not updated.
+        The gradients are summed on device, averaged and applied once, and
+        the latent average is updated once with the mean over the
+        micro-batches, as for the full batch. Returns the averaged loss.
+        """
+        K = self.num_accumulation
+
+        def get_micro_batch(x, k):
+            if K == 1:
+                return x
+            shape = tf.shape(x)
+            group_size = tf.minimum(self.batch_std_group_size, shape[0])
+            x = tf.reshape(x, tf.concat([[group_size, K, -1], shape[1:]], axis=0))
+            return tf.reshape(x[:, k], tf.concat([[-1], shape[1:]], axis=0))
+
+        def get_micro_seed(k):
+            if noise_seed is None or K == 1:
+                return noise_seed
+            return noise_seed * [1, K] + [0, k]
+
+        # The first micro-batch runs before the loop, which tells the
+        # variables without gradients, e.g. of the blocks after the phase.
+        grads, loss, latent_mean = micro_step(
+            [get_micro_batch(x, 0) for x in inputs], get_micro_seed(0))
+        indices = [i for i, g in enumerate(grads) if g is not None]
+        grads_sum = [grads[i] for i in indices]
+        if K > 1:
+            for k in tf.range(1, K):
+                grads, loss_k, latent_mean_k = micro_step(
+                    [get_micro_batch(x, k) for x in inputs], get_micro_seed(k))
+                grads_sum = [g + grads[i] for g, i in zip(grads_sum, indices)]
+                loss += loss_k
+                if latent_mean is not None:
+                    latent_mean += latent_mean_k
+            grads_sum = [g / K for g in grads_sum]
+            loss /= K
+            if latent_mean is not None:
+                latent_mean /= K
+
+        optimizer.apply_gradients(
+            zip(grads_sum, [trainable_vars[i] for i in indices]))
+        if latent_mean is not None:
+            self.generator_mix_style.mix_style.update_latent_avg_with(latent_mean)
+        return loss
 
-        with tf.GradientTape() as tape:
-            latent1 = self.generator_mapping(z)
-            latent2 = self.generator_mapping(z2)
-            latent = self.generator_mix_style(
-                [lod, latent1, latent2], training=True)
-            images_gen = self.generator_synthesis(
-                [lod, latent, *noises], training=True)
-            logits_fake = self.discriminator(
-                [lod, images_gen], training=True)
+    def map_latents(self, z, training=True):
+        """Return the inputs (latent1, latent2) of the style mixer for `z`.
+
+        In training with style mixing, `z` and a random second `z` are
+        mapped in one pass over the concatenated batch. Otherwise the mixer
+        does not use latent2, so it is not computed and latent1 is returned
+        in its place.
+        """
+        if training and self.mixing_prob is not None:
+            z2 = tf.random.normal(tf.shape(z))
+            latents = self.generator_mapping(tf.concat([z, z2], axis=0))
+            latent1, latent2 = tf.split(latents, 2)
+            return latent1, latent2
+        latent1 = self.generator_mapping(z)
+        return latent1, latent1
 
-            with tf.GradientTape() as tape2:
-                tape2.watch(images)
+    def generate(self, z, lod, noises, noise_seed=None, lod_phase=None):
+        """Generate training images from `z`, updating the latent average."""
+        latent1, latent2 = self.map_latents(z)
+        latent = self.generator_mix_style(
+            [lod, latent1, latent2], training=True)
+        return self.generator_synthesis(
+            [lod, latent, *noises], training=True, noise_seed=noise_seed,
+            lod_phase=lod_phase)
+
+    def generate_with_latent_mean(self, z, lod, noises, noise_seed=None,
+                                  lod_phase=None):
+        """Generate training images from `z` without updating the latent
+        average. Returns the images and the mean of the first latents.
+        """
+        latent1, latent2 = self.map_latents(z)
+        latent = self.generator_mix_style(
+            [lod, latent1, latent2], training=True, update_latent_avg=False)
+        images_gen = self.generator_synthesis(
+            [lod, latent, *noises], training=True, noise_seed=noise_seed,
+            lod_phase=lod_phase)
+        latent_mean = tf.reduce_mean(tf.cast(latent1[:, 0], tf.float32), axis=0)
+        return images_gen, latent_mean
+
+    def get_disc_logits(self, images, lod, lod_phase=None, grad_penalty=False,
+                        images_gen=None):
+        """Return the logits of the real and the fake images and the R1 penalty.
+
+        `images` are the real images as fed to the step. The penalty is None
+        if `grad_penalty` is False, which needs no nested tape. The logits of
+        the fake images are None if `images_gen` is None; otherwise they are
+        computed in the same discriminator pass as the real images.
+        """
+        images = convert_images(images)
+
+        def get_logits(images):
+            if lod_phase is None:
                 images_real = image_resizer(
                     images, lod, res=self.image_res, mode=self.mode)
+            else:
+                images_real = image_resizer_native(images, lod, lod_phase)
+            if images_gen is None:
                 logits_real = self.discriminator(
-                    [lod, images_real], training=True)
+                    [lod, images_real], training=True, lod_phase=lod_phase)
+                return logits_real, None
+            logits = self.discriminator(
+                [lod, tf.concat([images_real, images_gen], axis=0)],
+                training=True, lod_phase=lod_phase, num_splits=2)
+            return tf.split(logits, 2)
+
+        if not grad_penalty:
+            return (*get_logits(images), None)
+        with tf.GradientTape() as tape:
+            tape.watch(images)
+            logits_real, logits_fake = get_logits(images)
+
+        if isinstance(self.train_optimizer_disc, LossScaleOptimizer):
+            # The gradient of the penalty is scaled like the loss of D.
+            loss_scale = self.get_loss_scale(self.train_optimizer_disc)
+            grads = tape.gradient(
+                logits_real, images,
+                output_gradients=loss_scale * tf.ones_like(logits_real))
+            grads /= loss_scale
+        else:
+            grads = tape.gradient(logits_real, images)
+        penalty = tf.reduce_sum(grads ** 2) / self.get_global_batch_size(images)
+        # A pyramid level is the average of factor ** 2 full resolution
+        # pixels, so its squared gradient norm is factor ** 2 larger.
+        factor = self.image_res // images.shape[1]
+        return logits_real, logits_fake, penalty / factor ** 2
+
+    def get_disc_loss(self, images, images_gen, lod, lod_phase=None):
+        """Return the discriminator loss.
+
+        `images` are the real images as fed to the step. The gradient
+        penalty is included unless it is applied lazily (see `get_r1_loss`).
+        """
+        grad_penalty = self.params.gp_weight != 0. and \
+            not self.is_lazy_regularization()
+        if self.disc_single_pass:
+            logits_real, logits_fake, penalty = self.get_disc_logits(
+                images, lod, lod_phase, grad_penalty=grad_penalty,
+                images_gen=images_gen)
+        else:
+            logits_fake = self.discriminator(
+                [lod, images_gen], training=True, lod_phase=lod_phase)
+            logits_real, _, penalty = self.get_disc_logits(
+                images, lod, lod_phase, grad_penalty=grad_penalty)
+
+        loss_fake = tf.nn.sigmoid_cross_entropy_with_logits(
+            labels=tf.zeros_like(logits_fake), logits=logits_fake)
+        loss_real = tf.nn.sigmoid_cross_entropy_with_logits(
+            labels=tf.ones_like(logits_real), logits=logits_real)
+        base_loss = loss_fake + loss_real
+        loss = tf.reduce_sum(base_loss) / self.get_global_batch_size(logits_real)
+
+        if grad_penalty:
+            loss += 0.5 * self.params.gp_weight * penalty
+        return loss
 
-            loss_fake = tf.nn.sigmoid_cross_entropy_with_logits(
-                labels=tf.zeros_like(logits_fake), logits=logits_fake)
-            loss_real = tf.nn.sigmoid_cross_entropy_with_logits(
-                labels=tf.ones_like(logits_real), logits=logits_real)
-            base_loss = loss_fake + loss_real
-            loss = tf.reduce_sum(base_loss) / self.params.batch_size
+    def get_r1_loss(self, images, lod, lod_phase=None):
+        """Return the lazy R1 penalty of the real `images`.
 
-            if self.params.gp_weight != 0.:
-                grads = tape2.gradient(logits_real, images)
-                grad_penalty = tf.reduce_sum(grads ** 2) / self.params.batch_size
-                loss += 0.5 * self.params.gp_weight * grad_penalty
+        It is applied every `r1_interval` D steps, so its weight is
+        multiplied by `r1_interval`.
+        """
+        _, _, penalty = self.get_disc_logits(
+            images, lod, lod_phase, grad_penalty=True)
+        return 0.5 * self.params.gp_weight * self.r1_interval * penalty
 
-        trainable_vars = self.discriminator.trainable_variables
-        grads = tape.gradient(loss, trainable_vars)
-        self.optimizer_disc.apply_gradients(zip(grads, trainable_vars))
-        return loss
+    def get_gen_loss(self, images_gen, lod, lod_phase=None):
+        logits_fake = self.discriminator(
+            [lod, images_gen], training=True, lod_phase=lod_phase)
+        loss = tf.nn.sigmoid_cross_entropy_with_logits(
+            labels=tf.ones_like(logits_fake), logits=logits_fake)
+        return tf.reduce_sum(loss) / self.get_global_batch_size(logits_fake)
+
+    def get_gen_trainable_variables(self):
+        return self.generator_synthesis.trainable_variables + \
+               self.generator_mapping.trainable_variables + \
+               self.generator_mix_style.trainable_variables
 
     @tf.function
-    @convert_to_tfdata_single_batch
+    @repeat_steps(num_outputs=1)
+    @get_next_from_iterator
+    @insert_device_batch
+    @insert_noise_seed
     @tpu_ops_decorator(mode='SUM')
-    def train_gen(self, inputs, lod):
-        z, _, *noises = inputs
-        z2 = tf.random.normal(tf.shape(z))
+    def train_disc(self, inputs, lod, noise_seed=None, lod_phase=None,
+                   regularize=False):
+        """Train the discriminator for one step.
+
+        With `lod_phase`, the Python int `ceil(lod)`, the generator output,
+        the real images and the discriminator input stay at the resolution
+        of that phase, and a graph is traced per phase.
+        With `regularize`, the lazy R1 penalty of the same real images is
+        applied in an extra optimizer step afterwards.
+        """
+        z, images, *noises = inputs
+        if self.device_dataset is not None:
+            images = self.device_dataset.gather(images, tf.shape(z)[0])
+        noise_seed = self.get_replica_noise_seed(noise_seed)
+        trainable_vars = self.discriminator.trainable_variables
 
-        with tf.GradientTape() as tape:
-            latent1 = self.generator_mapping(z)
-            latent2 = self.generator_mapping(z2)
-            latent = self.generator_mix_style(
-                [lod, latent1, latent2], training=True)
-            images_gen = self.generator_synthesis(
-                [lod, latent, *noises], training=True)
-            logits_fake = self.discriminator(
-                [lod, images_gen], training=True)
+        def micro_step(inputs, noise_seed):
+            z, images, *noises = inputs
+            # Only D gets gradients, so the generator runs outside the tape.
+            images_gen, latent_mean = self.generate_with_latent_mean(
+                z, lod, noises, noise_seed, lod_phase)
+            with tf.GradientTape() as tape:
+                loss = self.get_disc_loss(images, images_gen, lod, lod_phase)
+            grads = self.get_gradients(
+                tape, loss, trainable_vars, self.train_optimizer_disc)
+            return grads, loss, latent_mean
+
+        loss = self.apply_accumulated_gradients(
+            micro_step, [z, images, *noises], noise_seed, trainable_vars,
+            self.train_optimizer_disc)
+
+        if regularize:
+            def reg_micro_step(inputs, noise_seed):
+                images, = inputs
+                with tf.GradientTape() as tape:
+                    loss = self.get_r1_loss(images, lod, lod_phase)
+                grads = self.get_gradients(
+                    tape, loss, trainable_vars, self.train_optimizer_disc)
+                return grads, loss, None
+
+            self.apply_accumulated_gradients(
+                reg_micro_step, [images], None, trainable_vars,
+                self.train_optimizer_disc)
+        return loss
 
-            loss = tf.nn.sigmoid_cross_entropy_with_logits(
-                labels=tf.ones_like(logits_fake), logits=logits_fake)
-            loss = tf.reduce_sum(loss) / self.params.batch_size
+    @tf.function
+    @repeat_steps(num_outputs=1)
+    @get_next_from_iterator
+    @insert_noise_seed
+    @tpu_ops_decorator(mode='SUM')
+    def train_gen(self, inputs, lod, noise_seed=None, lod_phase=None):
+        z, *noises = inputs
+        noise_seed = self.get_replica_noise_seed(noise_seed)
+        trainable_vars = self.get_gen_trainable_variables()
+
+        def micro_step(inputs, noise_seed):
+            z, *noises = inputs
+            with tf.GradientTape() as tape:
+                images_gen, latent_mean = self.generate_with_latent_mean(
+                    z, lod, noises, noise_seed, lod_phase)
+                loss = self.get_gen_loss(images_gen, lod, lod_phase)
+            grads = self.get_gradients(
+                tape, loss, trainable_vars, self.train_optimizer_gen)
+            return grads, loss, latent_mean
+
+        return self.apply_accumulated_gradients(
+            micro_step, [z, *noises], noise_seed, trainable_vars,
+            self.train_optimizer_gen)
 
-        trainable_vars = self.generator_synthesis.trainable_variables + \
-                         self.generator_mapping.trainable_variables + \
-                         self.generator_mix_style.trainable_variables
-        grads = tape.gradient(loss, trainable_vars)
-        self.optimizer_gen.apply_gradients(zip(grads, trainable_vars))
-        return loss
+    @tf.function
+    @repeat_steps(num_outputs=2)
+    @get_next_from_iterator
+    @insert_device_batch
+    @insert_noise_seed
+    @tpu_ops_decorator(mode='SUM')
+    def train_step(self, inputs, lod, noise_seed=None, lod_phase=None,
+                   update_disc=True, update_gen=True, regularize=False):
+        """Train the discriminator and then the generator in one call.
+
+        Takes the inputs of `train_disc`. The fake images are generated once
+        under the tape of the generator: the discriminator is updated on them
+        with their gradient stopped, then the generator is updated through
+        the updated discriminator. `update_disc` and `update_gen` are Python
+        bools, e.g. from `iter_ratio`, and `regularize` applies the lazy R1
+        penalty after the D update as in `train_disc`. Returns (D loss, G loss), 0 if skipped.
+        Like `train_disc` and `train_gen`, it runs `num_steps` steps in one
+        call if given and then returns the losses of every step.
+        """
+        z, images, *noises = inputs
+        if self.device_dataset is not None:
+            images = self.device_dataset.gather(images, tf.shape(z)[0])
+        noise_seed = self.get_replica_noise_seed(noise_seed)
+        d_loss = tf.constant(0.0)
+        g_loss = tf.constant(0.0)
+
+        with tf.GradientTape() as tape_gen:
+            images_gen = self.generate(z, lod, noises, noise_seed, lod_phase)
+
+            if update_disc:
+                with tape_gen.stop_recording():
+                    with tf.GradientTape() as tape_disc:
+                        d_loss = self.get_disc_loss(
+                            images, tf.stop_gradient(images_gen), lod, lod_phase)
+                    self.apply_gradients(
+                        tape_disc, d_loss, self.discriminator.trainable_variables,
+                        self.train_optimizer_disc)
+                    if regularize:
+                        with tf.GradientTape() as tape_reg:
+                            reg_loss = self.get_r1_loss(images, lod, lod_phase)
+                        self.apply_gradients(
+                            tape_reg, reg_loss,
+                            self.discriminator.trainable_variables,
+                            self.train_optimizer_disc)
+
+            if update_gen:
+                g_loss = self.get_gen_loss(images_gen, lod, lod_phase)
+
+        if update_gen:
+            self.apply_gradients(
+                tape_gen, g_loss, self.get_gen_trainable_variables(),
+                self.train_optimizer_gen)
+        return d_loss, g_loss
 
     @tf.function
     @convert_to_tfdata_single_batch
     @tpu_ops_decorator(mode=None)
-    def eval_gen(self, inputs, lod):
-        z, _, *noises = inputs
-        z2 = tf.random.normal(tf.shape(z))
-        latent1 = self.generator_mapping(z)
-        latent2 = self.generator_mapping(z2)
+    def eval_gen(self, inputs, lod, lod_phase=None):
+        """Generate images at the full resolution.
+
+        With `lod_phase`, only the blocks of that phase are run and the
+        images are upsampled afterwards.
+        """
+        z, *noises = inputs
+        latent1, latent2 = self.map_latents(z, training=False)
         latent = self.generator_mix_style(
             [lod, latent1, latent2], training=False)
+        if lod_phase is not None:
+            noises = noises[:lod_phase + 1]
         images_gen = self.generator_synthesis(
-            [lod, latent, *noises], training=False)
+            [lod, latent, *noises], training=False, lod_phase=lod_phase)
+        factor = self.image_res // images_gen.shape[1]
+        if factor > 1:
+            images_gen = upsample_nearest(images_gen, factor)
         return images_gen
 
     @tpu_decorator
@@ -213,7 +646,8 @@ class StyleGANModel(BaseModel):
                         weights_per_var[slot_name] = opt.get_slot(v, slot_name).numpy()
                     opt_weights[opt._name][model.name][v.name] = weights_per_var
 
-        return {'model': model_weights, 'optimizer': opt_weights}
+        return {'model': model_weights, 'optimizer': opt_weights,
+                'noise_step': self.noise_step.numpy()}
 
     def _set_model_weights(self, model, weights):
         for tensor in model.weights:
@@ -234,8 +668,11 @@ class StyleGANModel(BaseModel):
                 continue
             v_opt = weights[v.name]
             for slot_name, v_opt_slot in v_opt.items():
-                initializer = tf.initializers.Constant(v_opt_slot)
-                opt.add_slot(v, slot_name, initializer=initializer)
+                if slot_name in opt.get_slot_names():
+                    opt.get_slot(v, slot_name).assign(v_opt_slot)
+                else:
+                    initializer = tf.initializers.Constant(v_opt_slot)
+                    opt.add_slot(v, slot_name, initializer=initializer)
 
     @tpu_decorator
     def set_weights(self, weights, load_optimizer=True):
@@ -246,6 +683,9 @@ class StyleGANModel(BaseModel):
         disc_models = [self.discriminator]
         opt_weights = weights['optimizer']
         model_weights = weights['model']
+        # The noises of a fixed noise_seed continue where they stopped.
+        if 'noise_step' in weights:
+            self.noise_step.assign(weights['noise_step'])
 
         for opt, models in zip(optimizers, [gen_models, disc_models]):
             opt_name = opt._name
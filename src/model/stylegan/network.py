@@ -17,12 +17,18 @@ def res2num_blocks(res):
     return num_div2(res) - 1
 
 def interpolate_clip(x1, x2, ratio):
-    ratio = tf.clip_by_value(ratio, 0.0, 1.0)
+    ratio = tf.cast(tf.clip_by_value(ratio, 0.0, 1.0), x1.dtype)
     rank = tf.rank(x1)
     shape = tf.concat([[-1], tf.ones(rank - 1, tf.int64)], axis=0)
     ratio = tf.reshape(ratio, shape)
     return x1 + ratio * (x2 - x1)
 
+def set_recompute(blocks, recompute_res=None):
+    # Recompute the activations of the blocks from `recompute_res` up
+    # in the backward pass instead of storing them.
+    for block in blocks:
+        block.recompute = recompute_res is not None and block.res >= recompute_res
+
 def get_initializer(distribution, use_wscale=True, relu_alpha=0):
     if use_wscale:
         if distribution in ['normal', 'truncated_normal']:
@@ -39,8 +45,26 @@ def get_initializer(distribution, use_wscale=True, relu_alpha=0):
 
 #===============================================================================
 
+def upsample_nearest(image, factor):
+    s = tf.shape(image)
+    ch = image.shape[-1]
+    h = tf.reshape(image, [-1, s[1], 1, s[2], 1, ch])
+    h = tf.tile(h, [1, 1, factor, 1, factor, 1])
+    y = tf.reshape(h, [-1, factor * s[1], factor * s[2], ch])
+    if image.shape[1] is not None and image.shape[2] is not None:
+        y.set_shape([None, factor * image.shape[1], factor * image.shape[2], ch])
+    return y
+
 def image_resizer(image, lod, res=32, mode=None):
     if mode is None: mode = 'dynamic'
+    res_in = image.shape[1]
+    if res_in is not None and res_in < res:
+        # `image` is the pyramid level of the current lod,
+        # so only the cross-fade with the next lower level is left.
+        y = image_resizer(image, lod, res=res_in, mode=mode)
+        with tf.name_scope('image_resizer'):
+            return upsample_nearest(y, res // res_in)
+
     num_blocks = res2num_blocks(res)
     with tf.name_scope('image_resizer'):
         lod = tf.cast(lod, tf.float32)
@@ -82,6 +106,23 @@ def image_resizer(image, lod, res=32, mode=None):
             y = tf.reshape(y, [-1, s[1], s[2], s[3]])
         return y
 
+def image_resizer_native(image, lod, lod_phase):
+    # Like `image_resizer`, but stays at the resolution of `lod_phase`.
+    res = 2 ** (lod_phase + 2)
+    with tf.name_scope('image_resizer_native'):
+        lod = tf.cast(lod, tf.float32)
+        lod = tf.reshape(lod, [-1])[0]
+        factor = image.shape[1] // res
+        if factor > 1:
+            ksize = (1, factor, factor, 1)
+            image = tf.nn.avg_pool(image, ksize, strides=ksize, padding='VALID')
+        if lod_phase > 0:
+            ksize = (1, 2, 2, 1)
+            image_low = tf.nn.avg_pool(image, ksize, strides=ksize, padding='VALID')
+            image = interpolate_clip(
+                image, upsample_nearest(image_low, 2), float(lod_phase) - lod)
+        return image
+
 #===============================================================================
 
 class AdaIN_block(Layer):
@@ -206,6 +247,7 @@ class generator_block(Layer):
         self.x_shape = input_shape
         self.res = res
         self.num_latent = num_latent
+        self.recompute = False
 
         with tf.name_scope(self.name) as scope:
             self.slice_noise0 = Lambda(lambda x: x[:, :, :, 0])
@@ -259,9 +301,15 @@ class generator_block(Layer):
         x = Input(self.x_shape)
         w = Input((2, self.num_latent))
         noise = Input((self.res, self.res, 2))
-        _ = self.call((x, w, noise))
+        _ = self.forward((x, w, noise))
 
     def call(self, inputs):
+        if self.recompute:
+            return tf.recompute_grad(
+                lambda x, w, noise: self.forward((x, w, noise)))(*inputs)
+        return self.forward(inputs)
+
+    def forward(self, inputs):
         x, w, noise = inputs
         noise0 = self.slice_noise0(noise)
         noise1 = self.slice_noise1(noise)
@@ -328,7 +376,8 @@ class SynthesisBlock(Layer):
                  lr_mul=1.0,
                  distribution='untruncated_normal',
                  **kwargs):
-        super(SynthesisBlock, self).__init__(**kwargs)
+        # No autocast, which would round `lod` with mixed precision.
+        super(SynthesisBlock, self).__init__(autocast=False, **kwargs)
         self.lod = tf.cast(lod, tf.float32)
 
         def res2num_filters(res):
@@ -380,6 +429,7 @@ class DynamicSynthesisBlock(SynthesisBlock):
     def call(self, inputs):
         @tf.function
         def _call(x, image_out, w, noise, lod):
+            lod = tf.cast(lod, tf.float32)
             if self.lod >= lod + 1:
                 x = self.x_out_layer(x)
                 image_out = self.image_out_layer(image_out)
@@ -420,14 +470,13 @@ class StaticSynthesisBlock(SynthesisBlock):
             **kwargs)
 
     def call(self, inputs):
-        @tf.function
-        def _call(x, image_out, w, noise, lod):
-            image_out = self.image_out_layer(image_out)
-            x = self.gen_block((x, w, noise))
-            y = self.toRGB(x)
-            image_out = interpolate_clip(y, image_out, self.lod - lod)
-            return x, image_out
-        return _call(*inputs)
+        x, image_out, w, noise, lod = inputs
+        lod = tf.cast(lod, tf.float32)
+        image_out = self.image_out_layer(image_out)
+        x = self.gen_block((x, w, noise))
+        y = self.toRGB(x)
+        image_out = interpolate_clip(y, image_out, self.lod - lod)
+        return x, image_out
 
 class GeneratorSynthesis(Model):
     def __init__(self, res_out=32,
@@ -440,13 +489,16 @@ class GeneratorSynthesis(Model):
                 use_wscale=True,
                 lr_mul=1.0,
                 distribution='untruncated_normal',
+                recompute_res=None,
                 **kwargs):
-        super(GeneratorSynthesis, self).__init__(**kwargs)
+        super(GeneratorSynthesis, self).__init__(autocast=False, **kwargs)
 
         if mode is not None and mode not in ['dynamic', 'static']:
             raise ValueError('Unknown mode: ' + mode)
         mode = 'dynamic' if mode is None else mode
+        self.mode = mode
 
+        self.res_out = res_out
         self.num_blocks = res2num_blocks(res_out)
 
         def res2num_filters(res):
@@ -486,18 +538,56 @@ class GeneratorSynthesis(Model):
                         use_wscale=use_wscale,
                         lr_mul=lr_mul,
                         distribution=distribution))
+        set_recompute(
+            [getattr(self, 'block{:}'.format(i)).gen_block
+             for i in range(1, self.num_blocks)], recompute_res)
+
+    def get_noises(self, batch_size, seed=None, num_blocks=None):
+        if num_blocks is None:
+            num_blocks = self.num_blocks
+        noises = [None for _ in range(num_blocks)]
+        for i in range(num_blocks):
+            res = 2 ** (i + 2)
+            shape = tf.stack([batch_size, res, res, 2])
+            if seed is None:
+                noises[i] = tf.random.normal(shape)
+            else:
+                seed_i = seed * [1, self.num_blocks] + [0, i]
+                noises[i] = tf.random.stateless_normal(shape, seed_i)
+        return noises
 
-    def call(self, inputs):
+    def call(self, inputs, noise_seed=None, lod_phase=None):
+        # With `lod_phase`, only the blocks up to that phase are run.
         lod, w, *noise = inputs
-        lod = tf.reshape(lod, [-1])[0]
+        lod = tf.cast(tf.reshape(lod, [-1])[0], tf.float32)
+        if len(noise) == 0:
+            num_blocks = None if lod_phase is None else lod_phase + 1
+            noise = self.get_noises(
+                tf.shape(w)[0], seed=noise_seed, num_blocks=num_blocks)
 
         x = self.const_block((w[:, :2], noise[0]))
-        image_out = self.image_out_layer0(x)
-
-        for i in range(1, self.num_blocks):
-            x, image_out = getattr(self, 'block{:}'.format(i))(
-                (x, image_out, w[:, 2 * i:2 * (i + 1)], noise[i], lod))
-        return image_out
+        if lod_phase is not None:
+            image_out = self.call_native(x, w, noise, lod, lod_phase)
+        else:
+            image_out = self.image_out_layer0(x)
+            for i in range(1, self.num_blocks):
+                x, image_out = getattr(self, 'block{:}'.format(i))(
+                    (x, image_out, w[:, 2 * i:2 * (i + 1)], noise[i], lod))
+        return tf.cast(image_out, tf.float32)
+
+    def call_native(self, x, w, noise, lod, lod_phase):
+        image_out = None
+        to_rgb = self.image_out_layer0
+        for i in range(1, lod_phase + 1):
+            block = getattr(self, 'block{:}'.format(i))
+            if i == lod_phase:
+                image_out = block.image_out_layer(to_rgb(x))
+            x = block.gen_block((x, w[:, 2 * i:2 * (i + 1)], noise[i]))
+            to_rgb = block.toRGB
+        y = to_rgb(x)
+        if image_out is None:
+            return y
+        return interpolate_clip(y, image_out, float(lod_phase) - lod)
 
 class GeneratorMapping(Model):
     def __init__(self,
@@ -563,13 +653,15 @@ class StyleMixer(Model):
         self.num_layers = 2 * num_blocks
 
         with tf.name_scope('generator_mix_style') as scope:
-            self.reshape_layer = Reshape((1, 1, 1))
+            # The latent average is always kept and updated in float32.
+            self.reshape_layer = Reshape((1, 1, 1), dtype='float32')
             self.mix_style = MixStyle(
                 self.num_layers,
                 mixing_prob=mixing_prob,
                 latent_avg_beta=latent_avg_beta,
                 truncation_psi=truncation_psi,
                 truncation_cutoff=truncation_cutoff,
+                dtype='float32',
                 name=scope + 'mix_style')
             self.initialize_layers()
 
@@ -579,10 +671,11 @@ class StyleMixer(Model):
         lod = Input((1,))
         _ = self.call((lod, latent1, latent2))
 
-    def call(self, inputs, training=None):
+    def call(self, inputs, training=None, update_latent_avg=True):
         lod, latent1, latent2 = inputs
         lod_tensor = self.reshape_layer(lod)
-        return self.mix_style((latent1, latent2, lod_tensor), training=training)
+        return self.mix_style((latent1, latent2, lod_tensor), training=training,
+                              update_latent_avg=update_latent_avg)
 
 #===============================================================================
 
@@ -663,8 +756,8 @@ class discriminator_block_output(Layer):
         inputs = Input(self.x_shape)
         _ = self.call(inputs)
 
-    def call(self, inputs):
-        h = self.batch_stddev(inputs)
+    def call(self, inputs, num_splits=1):
+        h = self.batch_stddev(inputs, num_splits=num_splits)
         h = self.conv(h)
         h = self.act0(h)
         h = self.flatten(h)
@@ -685,6 +778,8 @@ class discriminator_block(Layer):
                  **kwargs):
         super(discriminator_block, self).__init__(**kwargs)
         self.x_shape = input_shape
+        self.res = res
+        self.recompute = False
 
         with tf.name_scope(self.name) as scope:
             self.act0 = LeakyReLU(alpha=0.2)
@@ -737,9 +832,31 @@ class discriminator_block(Layer):
 
     def initialize_layers(self):
         inputs = Input(self.x_shape)
-        _ = self.call(inputs)
+        _ = self.forward(inputs)
 
     def call(self, inputs):
+        if self.recompute:
+            return tf.recompute_grad(self.get_recomputed_forward())(inputs)
+        return self.forward(inputs)
+
+    def get_recomputed_forward(self):
+        # The recomputation reuses sigma of the first call and does not
+        # update the singular vectors again.
+        sn_layers = [l for l in [self.conv0, self.conv1] if isinstance(l, SNConv2D)]
+        num_calls = [0]
+
+        def forward(inputs):
+            for layer in sn_layers:
+                layer.reuse_sigma = num_calls[0] > 0
+            num_calls[0] += 1
+            try:
+                return self.forward(inputs)
+            finally:
+                for layer in sn_layers:
+                    layer.reuse_sigma = False
+        return forward
+
+    def forward(self, inputs):
         h = self.conv0(inputs)
         h = self.act0(h)
         h = self.blur(h)
@@ -809,7 +926,7 @@ class BaseDiscriminatorBlock(Layer):
                  distribution='untruncated_normal',
                  use_sn=False,
                  **kwargs):
-        super(BaseDiscriminatorBlock, self).__init__(**kwargs)
+        super(BaseDiscriminatorBlock, self).__init__(autocast=False, **kwargs)
         self.lod = tf.cast(lod, tf.float32)
 
         def res2num_filters(res):
@@ -859,6 +976,7 @@ class DynamicDiscriminatorBlock(BaseDiscriminatorBlock):
     def call(self, inputs):
         @tf.function
         def _call(x, image, lod):
+            lod = tf.cast(lod, tf.float32)
             image = self.down_sample(image)
             if self.lod >= lod + 1:
                 x = self.fromRGB(image)
@@ -898,14 +1016,13 @@ class StaticDiscriminatorBlock(BaseDiscriminatorBlock):
             **kwargs)
 
     def call(self, inputs):
-        @tf.function
-        def _call(x, image, lod):
-            image = self.down_sample(image)
-            y = self.fromRGB(image)
-            x = self.block(x)
-            x = interpolate_clip(x, y, self.lod - lod)
-            return x, image
-        return _call(*inputs)
+        x, image, lod = inputs
+        lod = tf.cast(lod, tf.float32)
+        image = self.down_sample(image)
+        y = self.fromRGB(image)
+        x = self.block(x)
+        x = interpolate_clip(x, y, self.lod - lod)
+        return x, image
 
 class Discriminator(Model):
     def __init__(self,
@@ -921,13 +1038,15 @@ class Discriminator(Model):
                 batch_std_group_size=4,
                 batch_std_num_features=1,
                 use_sn=False,
+                recompute_res=None,
                 **kwargs):
-        super(Discriminator, self).__init__(**kwargs)
+        super(Discriminator, self).__init__(autocast=False, **kwargs)
 
         if mode is not None and mode not in ['dynamic', 'static']:
             raise ValueError('Unknown mode: ' + mode)
         self.mode = 'dynamic' if mode is None else mode
 
+        self.res = res
         self.num_blocks = res2num_blocks(res)
 
         def res2num_filters(res):
@@ -976,13 +1095,55 @@ class Discriminator(Model):
                 batch_std_group_size=batch_std_group_size,
                 batch_std_num_features=batch_std_num_features,
                 use_sn=use_sn, name='discriminator_block_output')
+        set_recompute(
+            [getattr(self, 'block{:}'.format(k)).block
+             for k in range(1, self.num_blocks)], recompute_res)
 
-    def call(self, inputs, training=None):
+    def call(self, inputs, training=None, lod_phase=None, num_splits=1):
+        # `num_splits` parts of the batch get separate minibatch stddevs.
         lod, image = inputs
-        lod = tf.reshape(lod, [-1])[0]
-        x = self.fromRGB0(image)
-
+        lod = tf.cast(tf.reshape(lod, [-1])[0], tf.float32)
+        if lod_phase is not None:
+            x = self.call_native(image, lod, lod_phase)
+        else:
+            x = self.fromRGB0(image)
+            for k in range(1, self.num_blocks):
+                x, image = getattr(self, 'block{:}'.format(k))((x, image, lod))
+        outputs = self.output_layer(x, num_splits=num_splits)
+        return tf.cast(outputs, tf.float32)
+
+    def call_native(self, image, lod, lod_phase):
+        # Block k has the lod `num_blocks - k`, so block k0 is the first one
+        # whose input has the resolution of the phase.
+        k0 = self.num_blocks - 1 - lod_phase
+        if k0 == 0:
+            x = self.fromRGB0(image)
+        else:
+            x = getattr(self, 'block{:}'.format(k0)).fromRGB(image)
+
+        for k in range(k0 + 1, self.num_blocks):
+            block = getattr(self, 'block{:}'.format(k))
+            if k == k0 + 1:
+                image = block.down_sample(image)
+                x = interpolate_clip(
+                    block.block(x), block.fromRGB(image), float(lod_phase) - lod)
+            else:
+                x = block.block(x)
+        self.update_skipped_singular_vectors(k0)
+        return x
+
+    def update_skipped_singular_vectors(self, k0):
+        # Running every block updates the spectral normalization of the faded
+        # out ones as well, so `call_native` does it for the skipped blocks.
+        skipped = [] if k0 == 0 else [self.fromRGB0]
         for k in range(1, self.num_blocks):
-            x, image = getattr(self, 'block{:}'.format(k))((x, image, lod))
-        outputs = self.output_layer(x)
-        return outputs
+            block = getattr(self, 'block{:}'.format(k))
+            if k <= k0:
+                skipped.append(block.block)
+            if k not in [k0, k0 + 1]:
+                skipped.append(block.fromRGB)
+        for layer in skipped:
+            for name in ['conv', 'conv0', 'conv1']:
+                conv = getattr(layer, name, None)
+                if isinstance(conv, SNConv2D):
+                    conv.update_singular_vector()
@@ -0,0 +1,83 @@
+import numpy as np
+import tensorflow as tf
+from src.model.stylegan.model import StyleGANModel
+
+class TestParams(object):
+    def __init__(self, use_sn_in_disc=False):
+        self.z_dim = 32
+        self.image_shape = (16, 16, 3)
+        self.batch_size = 8
+        self.learning_rate = 1.0e-3
+        self.lr_beta1 = 0.0
+        self.lr_beta2 = 0.99
+        self.gp_weight = 10.0
+        self.distribution = 'untruncated_normal'
+        self.mixing_prob = None
+        self.use_sn_in_disc = use_sn_in_disc
+        self.noise_seed = 0
+
+def make_iterators(params, seed=0):
+    """Return the iterators over the inputs of `train_disc` and `train_gen`."""
+    rng = np.random.RandomState(seed)
+    res = params.image_shape[0]
+    z = rng.normal(size=(params.batch_size, params.z_dim)).astype(np.float32)
+    images = rng.randint(0, 256, size=(params.batch_size,) + params.image_shape)
+    noises = [rng.normal(size=(params.batch_size, 2 ** (i + 2), 2 ** (i + 2), 2))
+              for i in range(int(np.log2(res)) - 1)]
+    noises = [n.astype(np.float32) for n in noises]
+    inputs_disc = (z, images.astype(np.uint8), *noises)
+    inputs_gen = (z, *noises)
+    return iter(tf.data.Dataset.from_tensors(inputs_disc).repeat()), \
+           iter(tf.data.Dataset.from_tensors(inputs_gen).repeat())
+
+def train(model, weights, lod, lod_phase, num_steps=2):
+    model.set_weights(weights)
+    iterator_disc, iterator_gen = make_iterators(model.params)
+    lod_input = tf.constant([lod], dtype=tf.float32)
+    losses = []
+    for _ in range(num_steps):
+        losses.append(model.train_disc(
+            iterator_disc, lod_input, lod_phase=lod_phase).numpy())
+        losses.append(model.train_gen(
+            iterator_gen, lod_input, lod_phase=lod_phase).numpy())
+    return losses, model.get_weights()
+
+def test_static_lod_phase_equivalence(use_sn_in_disc=False):
+    """Specialized static steps give the results of running every block."""
+    model = StyleGANModel(TestParams(use_sn_in_disc), mode='static')
+    weights = model.get_weights()
+    for lod in [0.0, 0.5, 1.0]:
+        lod_phase = int(np.ceil(lod))
+        losses_phase, weights_phase = train(model, weights, lod, lod_phase)
+        losses_full, weights_full = train(model, weights, lod, None)
+        np.testing.assert_allclose(losses_phase, losses_full, rtol=1e-4, atol=1e-5)
+        for name, model_weights in weights_full['model'].items():
+            for key, w in model_weights.items():
+                np.testing.assert_allclose(
+                    weights_phase['model'][name][key], w, rtol=1e-4, atol=1e-5)
+
+def test_static_lod_phase_equivalence_sn():
+    """The singular vectors of the skipped blocks are updated as well."""
+    test_static_lod_phase_equivalence(use_sn_in_disc=True)
+
+def test_optimizer_slots():
+    """Every variable has optimizer slots, also before it is trained."""
+    model = StyleGANModel(TestParams(), mode='static')
+    train(model, model.get_weights(), 0.0, 0, num_steps=1)
+    for opt in [model.optimizer_disc, model.optimizer_gen]:
+        assert set(opt.get_slot_names()) >= {'m', 'v'}
+    model.initialize_optimizer()
+    opt_weights = model.get_weights()['optimizer']
+    for opt_name, models in opt_weights.items():
+        for name, var_weights in models.items():
+            if name == 'iter':
+                continue
+            for slots in var_weights.values():
+                for slot in slots.values():
+                    assert np.all(slot == 0)
+
+if __name__ == '__main__':
+    test_static_lod_phase_equivalence()
+    test_static_lod_phase_equivalence_sn()
+    test_optimizer_slots()
+    print('ok')
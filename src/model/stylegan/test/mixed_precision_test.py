@@ -0,0 +1,83 @@
+import numpy as np
+import tensorflow as tf
+from src.model.stylegan import network
+from src.model.stylegan.network import Discriminator, GeneratorSynthesis
+from src.model.stylegan.model import StyleGANModel
+from src.model.stylegan.test.lod_phase_test import TestParams, make_iterators
+
+def record_ratios(build, call, policy):
+    """Return the fade-in ratios of `interpolate_clip` in a call under `policy`."""
+    ratios = []
+    interpolate_clip = network.interpolate_clip
+    def recording_interpolate_clip(x1, x2, ratio):
+        ratios.append(tf.cast(ratio, tf.float32).numpy())
+        return interpolate_clip(x1, x2, ratio)
+
+    tf.keras.mixed_precision.experimental.set_policy(policy)
+    try:
+        model = build()
+        network.interpolate_clip = recording_interpolate_clip
+        call(model)
+    finally:
+        network.interpolate_clip = interpolate_clip
+        tf.keras.mixed_precision.experimental.set_policy('float32')
+    return ratios
+
+def test_discriminator_lod():
+    """A fractional lod gives the same mixing ratios with mixed precision."""
+    lod = tf.constant([1.3], dtype=tf.float32)
+    image = tf.zeros([4, 16, 16, 3])
+    build = lambda: Discriminator(res=16, fmap_max=32, mode='static')
+    call = lambda D: D([lod, image])
+    ratios = record_ratios(build, call, 'float32')
+    ratios_mixed = record_ratios(build, call, 'mixed_float16')
+    assert len(ratios) > 0
+    np.testing.assert_array_equal(ratios, ratios_mixed)
+
+def test_generator_lod():
+    lod = tf.constant([1.3], dtype=tf.float32)
+    w = tf.zeros([4, 6, 32])
+    noises = [tf.zeros([4, 2 ** (i + 2), 2 ** (i + 2), 2]) for i in range(3)]
+    build = lambda: GeneratorSynthesis(
+        res_out=16, num_latent=32, fmap_max=32, mode='static')
+    call = lambda G: G([lod, w, *noises])
+    ratios = record_ratios(build, call, 'float32')
+    ratios_mixed = record_ratios(build, call, 'mixed_float16')
+    assert len(ratios) > 0
+    np.testing.assert_array_equal(ratios, ratios_mixed)
+
+def test_float16_train_step():
+    """A float16 step has finite losses and updates the dynamic loss scales."""
+    params = TestParams()
+    params.mixed_precision = 'float16'
+    try:
+        model = StyleGANModel(params, mode='static')
+        iterator_disc, iterator_gen = make_iterators(params)
+        lod = tf.constant([1.0], dtype=tf.float32)
+        d_loss = model.train_disc(iterator_disc, lod).numpy()
+        g_loss = model.train_gen(iterator_gen, lod).numpy()
+    finally:
+        tf.keras.mixed_precision.experimental.set_policy('float32')
+    assert np.isfinite(d_loss) and np.isfinite(g_loss)
+    for opt in [model.train_optimizer_disc, model.train_optimizer_gen]:
+        # A step with finite gradients counts as a good step, otherwise
+        # the loss scale is lowered.
+        loss_scale = opt.loss_scale
+        assert int(loss_scale._num_good_steps.numpy()) == 1 or \
+            float(loss_scale()) < loss_scale.initial_loss_scale
+
+def test_policy_reset():
+    """A model without mixed precision is built in float32 again."""
+    params = TestParams()
+    params.mixed_precision = 'float16'
+    StyleGANModel(params, mode='static')
+    model = StyleGANModel(TestParams(), mode='static')
+    assert tf.keras.mixed_precision.experimental.global_policy().name == 'float32'
+    assert model.discriminator.output_layer.conv._compute_dtype == 'float32'
+
+if __name__ == '__main__':
+    test_discriminator_lod()
+    test_generator_lod()
+    test_float16_train_step()
+    test_policy_reset()
+    print('ok')
@@ -1,4 +1,9 @@
 from . import decorator
 from . import image_utils
+from . import dataset_cache
+from . import parallel_reader
+from . import shared_dataset
 from . import dataset_utils
+from . import input_pipeline
+from . import device_dataset
 from . import utils
@@ -0,0 +1,137 @@
+import os
+import json
+import numpy as np
+from . import image_utils
+
+# The cache of a dataset consists of one raw .npy file per split and key
+# ('images' or 'labels') and an index file `<dataset_name>.json` listing them.
+# The index file is written last, so a split is complete if it is listed in
+# the index. Splits can be added to an existing cache one at a time.
+# An image pyramid adds one more file per resolution with key 'images_RxR'.
+
+def get_index_path(cache_dir, dataset_name):
+    return os.path.join(cache_dir, dataset_name + '.json')
+
+def get_array_path(cache_dir, dataset_name, split, key='images'):
+    return os.path.join(
+        cache_dir, '{:}_{:}_{:}.npy'.format(dataset_name, split, key))
+
+def exists(cache_dir, dataset_name, split=None):
+    """Return whether the cache has the dataset, or its `split` if given."""
+    if not os.path.exists(get_index_path(cache_dir, dataset_name)):
+        return False
+    return split is None or split in load_index(cache_dir, dataset_name)
+
+def create_array(path, shape, dtype=np.uint8):
+    """Create a writable memmap which `commit_array` moves to `path`."""
+    dirname = os.path.dirname(path)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
+    return np.lib.format.open_memmap(
+        path + '.tmp', mode='w+', dtype=dtype, shape=tuple(shape))
+
+def commit_array(array, path):
+    array.flush()
+    os.replace(array.filename, path)
+
+def save_array(path, array):
+    out = create_array(path, array.shape, dtype=array.dtype)
+    out[...] = array
+    commit_array(out, path)
+    del out
+
+def save(cache_dir, dataset_name, datasets):
+    """Write {split: {key: array or None}} as the cache of a dataset.
+
+    An array shared by several splits is written only once.
+    """
+    index = {}
+    saved = {}
+    for split, arrays in datasets.items():
+        index[split] = {}
+        for key, array in arrays.items():
+            if array is None:
+                index[split][key] = None
+                continue
+            if id(array) not in saved:
+                path = get_array_path(cache_dir, dataset_name, split, key)
+                save_array(path, array)
+                saved[id(array)] = path
+            index[split][key] = saved[id(array)]
+    save_index(cache_dir, dataset_name, index)
+
+def save_index(cache_dir, dataset_name, index):
+    """Write the index. `index` maps each split to {key: path or None}.
+
+    The splits of an existing index which are not in `index` are kept.
+    """
+    index = {split: {key: None if path is None else os.path.basename(path)
+                     for key, path in arrays.items()}
+             for split, arrays in index.items()}
+    if exists(cache_dir, dataset_name):
+        index = dict(load_index(cache_dir, dataset_name), **index)
+    path = get_index_path(cache_dir, dataset_name)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(index, f, indent=4)
+    os.replace(path + '.tmp', path)
+
+def load_index(cache_dir, dataset_name):
+    with open(get_index_path(cache_dir, dataset_name), 'r') as f:
+        return json.load(f)
+
+def has_pyramid(cache_dir, dataset_name, splits=None):
+    index = load_index(cache_dir, dataset_name)
+    for split, arrays in index.items():
+        if splits is not None and split not in splits:
+            continue
+        if arrays['images'] is not None and \
+           not any(key.startswith('images_') for key in arrays.keys()):
+            return False
+    return True
+
+def build_pyramid(cache_dir, dataset_name, splits=None, chunk_size=1000):
+    """Add the image pyramid of `splits` (default: all) to the cache."""
+    index = load_index(cache_dir, dataset_name)
+    if splits is not None:
+        index = {split: index[split] for split in splits}
+    built = {}
+    for split, arrays in index.items():
+        filename = arrays['images']
+        if filename is None:
+            continue
+        if filename not in built:
+            images = np.load(os.path.join(cache_dir, filename), mmap_mode='r')
+            N, res, _, ch = images.shape
+            paths = {}
+            out = {}
+            for res in image_utils.get_pyramid_levels(res):
+                key = image_utils.get_pyramid_key(res)
+                paths[key] = get_array_path(cache_dir, dataset_name, split, key)
+                out[res] = create_array(paths[key], (N, res, res, ch))
+            image_utils.build_pyramid(images, out=out, chunk_size=chunk_size)
+            for res, array in out.items():
+                commit_array(array, paths[image_utils.get_pyramid_key(res)])
+            del images, out
+            built[filename] = paths
+        arrays.update(built[filename])
+    save_index(cache_dir, dataset_name, index)
+
+def load(cache_dir, dataset_name, splits=None, mmap_mode='r'):
+    """Open the arrays of `splits` (default: all) of a cache as `np.memmap`.
+
+    Returns {split: {key: array or None}}. A file shared by several splits
+    is opened only once.
+    """
+    index = load_index(cache_dir, dataset_name)
+    if splits is not None:
+        index = {split: index[split] for split in splits}
+    opened = {}
+    datasets = {}
+    for split, arrays in index.items():
+        datasets[split] = {}
+        for key, filename in arrays.items():
+            if filename is not None and filename not in opened:
+                opened[filename] = np.load(
+                    os.path.join(cache_dir, filename), mmap_mode=mmap_mode)
+            datasets[split][key] = None if filename is None else opened[filename]
+    return datasets
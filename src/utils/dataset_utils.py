@@ -1,41 +1,324 @@
+import os
+import json
+import collections.abc
 import numpy as np
 import tensorflow as tf
-from ..dataset import flickr_face
+from . import dataset_cache, image_utils, shared_dataset
+from ..dataset import flickr_face, image_folder, synthetic
 
-def get_dataset(dataset_name, *args, **kwargs):
+SPLITS = ('train', 'test')
+
+# Registered datasets. A loader is called as
+# `loader(split, *args, shard=None, num_workers=None, resize_method='bicubic',
+# **kwargs)` and returns {'images': array or None, 'labels': array or None}.
+# 'synthetic<res>[_<num_train>]', e.g. 'synthetic256', are procedural images
+# of shape (res, res, 3) which need no files (see `dataset.synthetic`).
+# 'synthetic<h>x<w>[x<ch>][_<num_train>]', e.g. 'synthetic64x32x1', gives
+# any other shape.
+# Image folders and archives are registered by `register_image_folder` or
+# under "image_folders" in 'dataset.json':
+#     "image_folders": {"<name>": {"train": <path>, "test": <path>, "res": 256}}
+_loaders = {}
+_image_folders = {}
+
+class LazySplits(collections.abc.Mapping):
+    """{split: {key: array}} whose splits are loaded on first access."""
+
+    def __init__(self, load_split, splits=SPLITS):
+        self.load_split = load_split
+        self.splits = tuple(splits)
+        self.loaded = {}
+
+    def __getitem__(self, split):
+        if split not in self.splits:
+            raise KeyError(split)
+        if split not in self.loaded:
+            self.loaded[split] = self.load_split(split)
+        return self.loaded[split]
+
+    def __iter__(self):
+        return iter(self.splits)
+
+    def __len__(self):
+        return len(self.splits)
+
+def register_dataset(dataset_name, loader):
+    _loaders[dataset_name.lower()] = loader
+
+def register_image_folder(dataset_name, train=None, test=None, res=None):
+    """Register directories or archives (.zip, .tar, .tar.gz) of images.
+
+    `train` and `test` are the sources of the splits, `res` the resolution
+    of the square images. Images in subdirectories get the index of their
+    subdirectory as label.
+    """
+    if res is None:
+        raise ValueError('Specify the resolution of image folder ' + dataset_name)
+    folder = {'train': train, 'test': test, 'res': res}
+    _image_folders[dataset_name.lower()] = folder
+
+    def loader(split, shard=None, num_workers=None, resize_method='bicubic'):
+        if folder[split] is None:
+            return {'images': None, 'labels': None}
+        return tuple_to_dict(image_folder.load_data(
+            folder[split], res, shard=shard, num_workers=num_workers,
+            resize_method=resize_method))
+    register_dataset(dataset_name, loader)
+
+def get_loader(dataset_name):
+    if dataset_name in _loaders:
+        return _loaders[dataset_name]
+    if 'flickr_face' in dataset_name:
+        def loader(split, *args, **kwargs):
+            return load_flickr_face(dataset_name, split, *args, **kwargs)
+        return loader
+    if dataset_name.startswith('synthetic'):
+        def loader(split, *args, **kwargs):
+            return load_synthetic(dataset_name, split, *args, **kwargs)
+        return loader
+    folders = load_image_folders()
+    if dataset_name in folders:
+        register_image_folder(dataset_name, **folders[dataset_name])
+        return _loaders[dataset_name]
+    raise ValueError('Unknown dataset name: ' + dataset_name)
+
+def load_image_folders():
+    if not os.path.exists('dataset.json'):
+        return {}
+    with open('dataset.json', 'r') as f:
+        d = json.load(f)
+    return {name.lower(): folder
+            for name, folder in d.get('image_folders', {}).items()}
+
+def get_dataset(dataset_name, *args, num_workers=None, cache_dir=None,
+                pyramid=False, resize_method='bicubic', shared_dir=None,
+                shard=None, **kwargs):
+    """Load a dataset as {'train': {...}, 'test': {...}}.
+
+    The splits are loaded on first access, so an unused split is never read.
+    If `cache_dir` is given, the arrays are returned as read-only `np.memmap`
+    of the preprocessed cache, which is built first if it does not exist.
+    If `pyramid` is True, the downscaled images of every resolution down to
+    4x4 are added under the keys 'images_RxR' (see `image_utils.build_pyramid`).
+    If `shared_dir` is given (e.g. '/dev/shm/stylegan'), the first process
+    publishes the arrays there and the others map the same memory
+    (see `shared_dataset`).
+    With `shard=(worker_index, num_workers)` only a contiguous slice of every
+    split is returned. Image folders and Flickr-Faces-HQ decode only that
+    slice, and a cache is only read in that slice.
+    """
     dataset_name = dataset_name.lower()
-    if dataset_name == 'cifar10':
-        datasets_train, datasets_test = \
-            tf.keras.datasets.cifar10.load_data(*args, **kwargs)
-    elif dataset_name == 'cifar100':
-        datasets_train, datasets_test = \
-            tf.keras.datasets.cifar100.load_data(*args, **kwargs)
-    elif dataset_name == 'mnist':
-        datasets_train, datasets_test = \
-            tf.keras.datasets.mnist.load_data(*args, **kwargs)
-        datasets_train = (datasets_train[0][..., np.newaxis], datasets_train[1])
-        datasets_test = (datasets_test[0][..., np.newaxis], datasets_test[1])
-    elif dataset_name == 'fashion_mnist':
-        datasets_train, datasets_test = \
-            tf.keras.datasets.fashion_mnist.load_data(*args, **kwargs)
-    elif 'flickr_face' in dataset_name:
-        s = dataset_name.replace('flickr_face', '')
-        if 'train' in s:
-            dataset_type = 'train'
-            res_str = s.replace('_train', '')
-        elif 'test' in s:
-            dataset_type = 'test'
-            res_str = s.replace('_test', '')
-        else:
-            dataset_type = None
-            res_str = s
-        res = int(res_str)
-        datasets_train, datasets_test = \
-            flickr_face.load_data(res, *args, dataset_type=dataset_type, **kwargs)
+
+    def load_split(split):
+        return get_split(
+            dataset_name, split, *args, num_workers=num_workers,
+            cache_dir=cache_dir, pyramid=pyramid, resize_method=resize_method,
+            shared_dir=shared_dir, shard=shard, **kwargs)
+    return LazySplits(load_split)
+
+def get_cache_name(dataset_name, resize_method='bicubic'):
+    """Return the name of the cache of a dataset resized by `resize_method`.
+
+    Caches of different resize methods are kept apart, so a cache is never
+    reused for another method. 'bicubic' keeps the plain dataset name.
+    """
+    if resize_method == 'bicubic':
+        return dataset_name
+    return dataset_name + '_' + resize_method
+
+def get_split(dataset_name, split, *args, num_workers=None, cache_dir=None,
+              pyramid=False, resize_method='bicubic', shared_dir=None,
+              shard=None, **kwargs):
+    """Load one split of a dataset as {key: array}. See `get_dataset`."""
+    cache_name = get_cache_name(dataset_name, resize_method)
+    if shared_dir is not None:
+        with shared_dataset.lock(shared_dir, cache_name):
+            if not dataset_cache.exists(shared_dir, cache_name, split):
+                arrays = get_split(
+                    dataset_name, split, *args, num_workers=num_workers,
+                    cache_dir=cache_dir, resize_method=resize_method, **kwargs)
+                dataset_cache.save(shared_dir, cache_name, {split: arrays})
+                del arrays
+            if pyramid and not dataset_cache.has_pyramid(
+                    shared_dir, cache_name, [split]):
+                dataset_cache.build_pyramid(shared_dir, cache_name, [split])
+            shared_dataset.acquire(shared_dir, cache_name)
+            arrays = dataset_cache.load(shared_dir, cache_name, [split])[split]
+        return shard_arrays(arrays, shard)
+
+    if cache_dir is not None:
+        # Sharded workers share the cache, so only the first one to take
+        # the lock builds it and the others wait for it.
+        with shared_dataset.lock(cache_dir, cache_name):
+            if not dataset_cache.exists(cache_dir, cache_name, split):
+                build_dataset_cache(
+                    dataset_name, cache_dir, *args, splits=[split],
+                    num_workers=num_workers, resize_method=resize_method,
+                    **kwargs)
+            if pyramid and not dataset_cache.has_pyramid(
+                    cache_dir, cache_name, [split]):
+                dataset_cache.build_pyramid(cache_dir, cache_name, [split])
+        arrays = dataset_cache.load(cache_dir, cache_name, [split])[split]
+        return shard_arrays(arrays, shard)
+
+    arrays = get_loader(dataset_name)(
+        split, *args, shard=shard, num_workers=num_workers,
+        resize_method=resize_method, **kwargs)
+    if pyramid:
+        add_pyramid(arrays)
+    return arrays
+
+def shard_arrays(arrays, shard):
+    """Slice every array of a split to the shard `(worker_index, num_workers)`."""
+    if shard is None:
+        return arrays
+    sliced = {}
+    for key, array in arrays.items():
+        if array is not None:
+            start, end = image_folder.get_shard(array.shape[0], shard)
+            array = array[start:end]
+        sliced[key] = array
+    return sliced
+
+def add_pyramid(arrays):
+    images = arrays['images']
+    if images is not None:
+        arrays.update({image_utils.get_pyramid_key(res): x
+                       for res, x in image_utils.build_pyramid(images).items()})
+
+def load_keras_dataset(load_data, add_channel=False):
+    """Return a loader of a dataset of `tf.keras.datasets`."""
+    def loader(split, *args, shard=None, num_workers=None,
+               resize_method='bicubic', **kwargs):
+        datasets_train, datasets_test = load_data(*args, **kwargs)
+        images, labels = datasets_train if split == 'train' else datasets_test
+        if add_channel:
+            images = images[..., np.newaxis]
+        return shard_arrays(tuple_to_dict((images, labels)), shard)
+    return loader
+
+register_dataset('cifar10', load_keras_dataset(tf.keras.datasets.cifar10.load_data))
+register_dataset('cifar100', load_keras_dataset(tf.keras.datasets.cifar100.load_data))
+register_dataset('mnist', load_keras_dataset(
+    tf.keras.datasets.mnist.load_data, add_channel=True))
+register_dataset('fashion_mnist', load_keras_dataset(
+    tf.keras.datasets.fashion_mnist.load_data))
+
+def load_flickr_face(dataset_name, split, shard=None, num_workers=None,
+                     resize_method='bicubic'):
+    res, dataset_type = parse_flickr_face_name(dataset_name)
+    if dataset_type not in (None, split):
+        return {'images': None, 'labels': None}
+    dataset_dir, resize_flag = flickr_face.get_source(res)
+    idx_start, idx_end = flickr_face.IDX_RANGES[dataset_type]
+    start, end = image_folder.get_shard(idx_end - idx_start, shard)
+    images = flickr_face.read_images(
+        dataset_dir, res, resize_flag, idx_range=(idx_start + start, idx_start + end),
+        num_workers=num_workers, resize_method=resize_method)
+    return {'images': images, 'labels': None}
+
+def load_synthetic(dataset_name, split, shard=None, num_workers=None,
+                   resize_method='bicubic', seed=0):
+    image_shape, num_train = parse_synthetic_name(dataset_name)
+    kwargs = {} if num_train is None else {'num_train': num_train}
+    datasets_train, datasets_test = synthetic.load_data(
+        image_shape, seed=seed, **kwargs)
+    datasets = datasets_train if split == 'train' else datasets_test
+    return shard_arrays(tuple_to_dict(datasets), shard)
+
+def build_dataset_cache(dataset_name, cache_dir, *args, splits=None,
+                        num_workers=None, resize_method='bicubic', **kwargs):
+    """Write the preprocessed uint8 arrays of a dataset to `cache_dir`.
+
+    `splits` are the splits to add to the cache (default: all).
+    Flickr-Faces-HQ and image folders are decoded straight into the cache
+    file, so the dataset never has to fit in memory.
+    The cache is named by `get_cache_name`.
+    """
+    dataset_name = dataset_name.lower()
+    cache_name = get_cache_name(dataset_name, resize_method)
+    if splits is None:
+        splits = SPLITS
+    if 'flickr_face' in dataset_name:
+        res, dataset_type = parse_flickr_face_name(dataset_name)
+        if dataset_type is None:
+            # Both splits are the same file.
+            splits = SPLITS
+        index = {split: {'images': None, 'labels': None} for split in splits}
+        if dataset_type is None or dataset_type in splits:
+            dataset_dir, resize_flag = flickr_face.get_source(res)
+            idx_range = flickr_face.IDX_RANGES[dataset_type]
+            split = 'test' if dataset_type == 'test' else 'train'
+            path = dataset_cache.get_array_path(cache_dir, cache_name, split)
+            images = dataset_cache.create_array(
+                path, (idx_range[1] - idx_range[0], res, res, 3))
+            flickr_face.read_images(
+                dataset_dir, res, resize_flag, idx_range=idx_range,
+                num_workers=num_workers, out=images, resize_method=resize_method)
+            dataset_cache.commit_array(images, path)
+            del images
+            for split in index.keys():
+                if dataset_type in (None, split):
+                    index[split]['images'] = path
+        dataset_cache.save_index(cache_dir, cache_name, index)
+        return
+
+    get_loader(dataset_name)  # registers the image folders of 'dataset.json'
+    if dataset_name in _image_folders:
+        folder = _image_folders[dataset_name]
+        index = {}
+        for split in splits:
+            index[split] = {'images': None, 'labels': None}
+            if folder[split] is None:
+                continue
+            names = image_folder.list_images(folder[split])
+            path = dataset_cache.get_array_path(cache_dir, cache_name, split)
+            images = dataset_cache.create_array(
+                path, (len(names), folder['res'], folder['res'], 3))
+            image_folder.read_images(
+                folder[split], names, folder['res'], num_workers=num_workers,
+                out=images, resize_method=resize_method)
+            dataset_cache.commit_array(images, path)
+            del images
+            index[split]['images'] = path
+            labels = image_folder.get_labels(names)
+            if labels is not None:
+                index[split]['labels'] = dataset_cache.get_array_path(
+                    cache_dir, cache_name, split, 'labels')
+                dataset_cache.save_array(index[split]['labels'], labels)
+        dataset_cache.save_index(cache_dir, cache_name, index)
+        return
+
+    for split in splits:
+        arrays = get_split(
+            dataset_name, split, *args, num_workers=num_workers,
+            resize_method=resize_method, **kwargs)
+        dataset_cache.save(cache_dir, cache_name, {split: arrays})
+
+def parse_flickr_face_name(dataset_name):
+    s = dataset_name.replace('flickr_face', '')
+    if 'train' in s:
+        dataset_type = 'train'
+        res_str = s.replace('_train', '')
+    elif 'test' in s:
+        dataset_type = 'test'
+        res_str = s.replace('_test', '')
     else:
-        raise ValueError('Unknown dataset name: ' + dataset_name)
-    return {'train': tuple_to_dict(datasets_train),
-            'test': tuple_to_dict(datasets_test)}
+        dataset_type = None
+        res_str = s
+    return int(res_str), dataset_type
+
+def parse_synthetic_name(dataset_name):
+    s = dataset_name.replace('synthetic', '').split('_')
+    num_train = int(s[1]) if len(s) > 1 else None
+    shape = [int(n) for n in s[0].split('x')]
+    if len(shape) == 1:
+        shape = shape * 2
+    if len(shape) == 2:
+        shape.append(3)
+    if len(shape) != 3:
+        raise ValueError('Unknown synthetic dataset: ' + dataset_name)
+    return tuple(shape), num_train
 
 def tuple_to_dict(datasets):
     return {'images': datasets[0], 'labels': datasets[1]}
@@ -16,7 +16,13 @@ def tpu_ops_decorator(mode):
             outputs = []
 
             if self.use_tpu:
-                _func = lambda *args, **kwargs: func(self, *args, **kwargs)
+                # Python values such as `lod_phase` are passed by closure,
+                # only tensors go through `experimental_run_v2`.
+                static_kwargs = {k: v for k, v in kwargs.items()
+                                 if v is None or isinstance(v, (bool, int, float, str))}
+                kwargs = {k: v for k, v in kwargs.items() if k not in static_kwargs}
+                _func = lambda *args, **kwargs: func(
+                    self, *args, **kwargs, **static_kwargs)
                 func_outputs = self.strategy.experimental_run_v2(_func, args=args, kwargs=kwargs)
             else:
                 func_outputs = func(self, *args, **kwargs)
@@ -42,6 +48,52 @@ def tpu_ops_decorator(mode):
         return wrapper
     return _tpu_ops_decorator
 
+def repeat_steps(num_outputs=1):
+    """Run a train step `num_steps` times in a `tf.range` loop of the graph.
+
+    The wrapped function gets the keyword argument `num_steps` (a Python
+    int, default 1). With `num_steps` > 1 the float32 scalar outputs of
+    every step are stacked, so they are returned to the host only once.
+    """
+    def _repeat_steps(func):
+        def wrapper(self, *args, num_steps=1, **kwargs):
+            if num_steps == 1:
+                return func(self, *args, **kwargs)
+            arrays = tuple(tf.TensorArray(tf.float32, size=num_steps)
+                           for _ in range(num_outputs))
+            for i in tf.range(num_steps):
+                outputs = func(self, *args, **kwargs)
+                if num_outputs == 1:
+                    outputs = (outputs,)
+                arrays = tuple(a.write(i, x) for a, x in zip(arrays, outputs))
+            outputs = tuple(a.stack() for a in arrays)
+            if num_outputs == 1:
+                return outputs[0]
+            return outputs
+        return wrapper
+    return _repeat_steps
+
+def get_next_from_iterator(func):
+    def wrapper(self, iterator, *args, **kwargs):
+        return func(self, next(iterator), *args, **kwargs)
+    return wrapper
+
+def insert_device_batch(func):
+    def wrapper(self, inputs, *args, **kwargs):
+        if self.device_dataset is not None:
+            z, *noises = inputs
+            indices = self.device_dataset.next_indices(self.batch_size)
+            inputs = (z, indices, *noises)
+        return func(self, inputs, *args, **kwargs)
+    return wrapper
+
+def insert_noise_seed(func):
+    def wrapper(self, inputs, *args, **kwargs):
+        if self.noise_in_graph:
+            kwargs['noise_seed'] = self.next_noise_seed()
+        return func(self, inputs, *args, **kwargs)
+    return wrapper
+
 def convert_to_tfdata_single_batch(func):
     def wrapper(self, inputs, *args, **kwargs):
         dataset = tf.data.Dataset.from_tensor_slices(inputs)
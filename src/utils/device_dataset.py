@@ -0,0 +1,68 @@
+import tensorflow as tf
+
+class DeviceDataset(object):
+    """Images uploaded once to device memory and sampled in graph.
+
+    The images and a shuffled index over them are kept in variables, so
+    a training step draws its batch without any host work. Create it in
+    the scope of the distribution strategy to mirror it on every replica.
+    """
+
+    def __init__(self, images, name='device_dataset'):
+        self.num_examples = int(images.shape[0])
+        with tf.name_scope(name):
+            self.build_images(images)
+            self.index = tf.Variable(
+                tf.random.shuffle(tf.range(self.num_examples)),
+                trainable=False, name='index')
+            self.position = tf.Variable(0, trainable=False, name='position')
+
+    def build_images(self, images):
+        self.images = tf.Variable(images, trainable=False, name='images')
+
+    def get_images(self, indices):
+        return tf.gather(self.images, indices)
+
+    def next_indices(self, batch_size):
+        """Return the indices of the next global batch.
+
+        The index is reshuffled when less than `batch_size` indices are left,
+        like a dataset batched with `drop_remainder=True`.
+        Call this in cross-replica context.
+        """
+        def reshuffle():
+            with tf.control_dependencies(
+                    [self.index.assign(tf.random.shuffle(self.index))]):
+                return tf.constant(0)
+        start = tf.cond(
+            self.position + batch_size > self.num_examples,
+            reshuffle,
+            lambda: self.position.read_value())
+        self.position.assign(start + batch_size)
+        return tf.slice(self.index, [start], [batch_size])
+
+    def gather(self, indices, batch_size):
+        """Return the images of this replica's part of the global batch.
+
+        `indices` is the output of `next_indices` and `batch_size` the
+        batch size per replica.
+        """
+        replica_id = tf.distribute.get_replica_context().replica_id_in_sync_group
+        indices = tf.slice(indices, [replica_id * batch_size], [batch_size])
+        return self.get_images(indices)
+
+class SyntheticDeviceDataset(DeviceDataset):
+    """Synthetic images generated on the devices instead of uploaded.
+
+    `images` is a `dataset.synthetic.SyntheticImages`. This measures the
+    model throughput without any input pipeline or device memory cost.
+    """
+
+    def __init__(self, images, name='synthetic_device_dataset'):
+        super().__init__(images, name=name)
+
+    def build_images(self, images):
+        self.images = images
+
+    def get_images(self, indices):
+        return self.images.generate_tf(indices)
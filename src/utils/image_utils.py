@@ -73,3 +73,37 @@ def convert_color_range(images,
     output_bias = output_range[0]
     images_normalized = (images.astype(dtype) - input_bias) / input_scale
     return images_normalized * output_scale + output_bias
+
+def get_pyramid_key(res):
+    return 'images_{0:}x{0:}'.format(res)
+
+def get_pyramid_levels(res, min_res=4):
+    """Return the resolutions below `res` which the image pyramid holds."""
+    levels = []
+    while res % 2 == 0 and res // 2 >= min_res:
+        res //= 2
+        levels.append(res)
+    return levels
+
+def build_pyramid(images, out=None, min_res=4, chunk_size=1000):
+    """Box-filter `images` down to every power-of-two resolution >= `min_res`.
+
+    Each level is averaged from the full resolution images in float and
+    rounded once, so levels do not accumulate rounding errors.
+    Returns {res: uint8 array}, writing into the arrays of `out` if given.
+    """
+    N, res, _, ch = images.shape
+    levels = get_pyramid_levels(res, min_res=min_res)
+
+    if out is None:
+        out = {}
+    for res in levels:
+        if res not in out:
+            out[res] = np.zeros([N, res, res, ch], dtype=np.uint8)
+
+    for i in range(0, N, chunk_size):
+        h = images[i:i + chunk_size].astype(np.float32)
+        for res in levels:
+            h = h.reshape([-1, res, 2, res, 2, ch]).mean(axis=(2, 4))
+            out[res][i:i + chunk_size] = np.rint(h).astype(np.uint8)
+    return out
@@ -0,0 +1,154 @@
+import time
+import threading
+import numpy as np
+import tensorflow as tf
+
+AUTOTUNE = tf.data.experimental.AUTOTUNE
+
+class ReadStats(object):
+    """Thread-safe counter of the bytes read by an input pipeline."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.num_bytes = 0
+            self.time_start = time.time()
+
+    def add(self, num_bytes):
+        with self.lock:
+            self.num_bytes += num_bytes
+
+    def get_throughput(self):
+        """Return MB/s read since the last reset."""
+        with self.lock:
+            elapsed = max(time.time() - self.time_start, 1.0e-6)
+            return self.num_bytes / 2 ** 20 / elapsed
+
+def make_image_dataset(images, batch_size, preprocess=None, in_graph=False,
+                       read_stats=None):
+    """Return an endless `tf.data.Dataset` of shuffled batches of `images`.
+
+    Every pass over the dataset is reshuffled. The batches are gathered from
+    `images` (an array or `np.memmap`) by parallel `tf.numpy_function` calls,
+    so the host prepares the next batches while the device runs a step and
+    only one batch at a time is read into memory.
+    If `in_graph` is True, the pipeline runs without Python, as required
+    when it does not run in this process, e.g. on a TPU host: an in-memory
+    array is captured as a constant and synthetic images
+    (`dataset.synthetic`) are generated in graph. A `np.memmap` cannot be
+    read then and raises a ValueError.
+    `preprocess` is an optional function applied to every batch.
+    `read_stats` is an optional `ReadStats` counting the bytes gathered.
+    """
+    N = images.shape[0]
+    shape = (batch_size,) + tuple(images.shape[1:])
+    dtype = tf.as_dtype(images.dtype)
+
+    if in_graph and hasattr(images, 'generate_tf'):
+        gather = images.generate_tf
+    elif in_graph:
+        if isinstance(images, np.memmap):
+            raise ValueError(
+                'A memory-mapped dataset cannot be read in graph, e.g. on TPU. '
+                'Load the dataset without cache_dir or use device_dataset.')
+        images_tensor = tf.convert_to_tensor(images)
+        def gather(indices):
+            return tf.gather(images_tensor, indices)
+    else:
+        def _gather(indices):
+            # Sorted indices make the reads of a memmap more sequential.
+            x = images[np.sort(indices)]
+            if read_stats is not None:
+                read_stats.add(x.nbytes)
+            return x
+        def gather(indices):
+            x = tf.numpy_function(_gather, [indices], dtype)
+            x.set_shape(shape)
+            return x
+
+    def map_func(indices):
+        x = gather(indices)
+        if preprocess is not None:
+            x = preprocess(x)
+        return x
+
+    dataset = tf.data.Dataset.range(N)
+    dataset = dataset.shuffle(N, reshuffle_each_iteration=True).repeat()
+    dataset = dataset.batch(batch_size, drop_remainder=True)
+    dataset = dataset.map(map_func, num_parallel_calls=AUTOTUNE)
+    return dataset.prefetch(AUTOTUNE)
+
+def make_block_shuffled_dataset(images, batch_size, block_size=256,
+                                buffer_size=4096, preprocess=None, read_stats=None):
+    """Return an endless dataset of batches of `images` shuffled by blocks.
+
+    The order of blocks of `block_size` consecutive images is shuffled, each
+    block is read with one sequential read and the images are shuffled in a
+    rolling buffer of `buffer_size` images. Compared to `make_image_dataset`
+    this trades randomness (see `block_shuffle_randomness`) for large
+    sequential reads, which keeps slow disks busy with a memmap.
+    """
+    N = images.shape[0]
+    num_blocks = (N + block_size - 1) // block_size
+    shape = (None,) + tuple(images.shape[1:])
+    dtype = tf.as_dtype(images.dtype)
+
+    def _read_block(block):
+        start = block * block_size
+        x = np.asarray(images[start:start + block_size])
+        if read_stats is not None:
+            read_stats.add(x.nbytes)
+        return x
+    def read_block(block):
+        x = tf.numpy_function(_read_block, [block], dtype)
+        x.set_shape(shape)
+        return x
+
+    dataset = tf.data.Dataset.range(num_blocks)
+    dataset = dataset.shuffle(num_blocks, reshuffle_each_iteration=True).repeat()
+    dataset = dataset.map(read_block, num_parallel_calls=AUTOTUNE)
+    dataset = dataset.unbatch().shuffle(buffer_size)
+    dataset = dataset.batch(batch_size, drop_remainder=True)
+    if preprocess is not None:
+        dataset = dataset.map(preprocess, num_parallel_calls=AUTOTUNE)
+    return dataset.prefetch(AUTOTUNE)
+
+def block_shuffle_randomness(N, batch_size, block_size=256, buffer_size=4096,
+                             num_batches=100, seed=None):
+    """Measure how random the batches of `make_block_shuffled_dataset` are.
+
+    Simulates the sampler on indices and returns the mean number of distinct
+    blocks in a batch relative to its expectation for a full shuffle,
+    which is 1.0 for a full shuffle and 1 / batch_size at worst.
+    """
+    rng = np.random.RandomState(seed)
+    num_blocks = (N + block_size - 1) // block_size
+
+    def stream():
+        while True:
+            for block in rng.permutation(num_blocks):
+                for i in range(block * block_size, min((block + 1) * block_size, N)):
+                    yield i
+    source = stream()
+    buffer = [next(source) for _ in range(buffer_size)]
+
+    distinct = 0
+    for _ in range(num_batches):
+        batch = []
+        for _ in range(batch_size):
+            k = rng.randint(len(buffer))
+            batch.append(buffer[k])
+            buffer[k] = next(source)
+        distinct += len(np.unique(np.array(batch) // block_size))
+
+    expected = num_blocks * (1 - (1 - 1 / num_blocks) ** batch_size)
+    return distinct / num_batches / expected
+
+def make_random_dataset(func):
+    """Return an endless `tf.data.Dataset` whose elements are `func()`."""
+    dataset = tf.data.Dataset.from_tensors(0).repeat()
+    dataset = dataset.map(lambda _: func(), num_parallel_calls=AUTOTUNE)
+    return dataset.prefetch(AUTOTUNE)
@@ -0,0 +1,73 @@
+import os
+import multiprocessing
+import numpy as np
+
+# Number of images decoded by a worker per task.
+CHUNK_SIZE = 250
+
+_worker = {}
+
+def read_chunks(out, load_chunk, args=(), initializer=None, initargs=(),
+                num_workers=None, progress=None):
+    """Fill `out` chunk by chunk with `load_chunk((start, end), *args)`.
+
+    `load_chunk` returns the array of the indices `range(start, end)` of
+    `out`. If `num_workers` is None, all cores are used. With more than one
+    worker the chunks are loaded by a process pool: the workers write them
+    directly into `out` if it is a `np.memmap` and otherwise return them to
+    be copied into `out`, so only the chunks in flight are held in addition.
+    `initializer(*initargs)` runs once per process before its first chunk,
+    e.g. to open an archive. Functions passed to the workers must be
+    picklable. `progress(num_loaded)` is called after every chunk.
+    """
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    N = len(out)
+    chunks = [(i, min(i + CHUNK_SIZE, N)) for i in range(0, N, CHUNK_SIZE)]
+
+    num_loaded = 0
+    if num_workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for chunk in chunks:
+            out[chunk[0]:chunk[1]] = load_chunk(chunk, *args)
+            num_loaded += chunk[1] - chunk[0]
+            if progress is not None:
+                progress(num_loaded)
+        return out
+
+    target = None
+    if isinstance(out, np.memmap):
+        target = (out.filename, out.offset, out.shape, out.dtype)
+    with multiprocessing.Pool(
+            num_workers, initializer=_init_worker,
+            initargs=(target, load_chunk, args, initializer, initargs)) as pool:
+        for chunk, x in pool.imap_unordered(_read_chunk, chunks):
+            if x is not None:
+                out[chunk[0]:chunk[1]] = x
+            num_loaded += chunk[1] - chunk[0]
+            if progress is not None:
+                progress(num_loaded)
+    return out
+
+def _init_worker(target, load_chunk, args, initializer, initargs):
+    if target is None:
+        _worker['out'] = None
+    else:
+        filename, offset, shape, dtype = target
+        _worker['out'] = np.memmap(
+            filename, dtype=dtype, mode='r+', shape=shape, offset=offset)
+    _worker['load_chunk'] = load_chunk
+    _worker['args'] = args
+    if initializer is not None:
+        initializer(*initargs)
+
+def _read_chunk(chunk):
+    """Load `chunk` into the memmap, or return it as (chunk, array)."""
+    x = _worker['load_chunk'](chunk, *_worker['args'])
+    out = _worker['out']
+    if out is None:
+        return chunk, x
+    out[chunk[0]:chunk[1]] = x
+    out.flush()
+    return chunk, None
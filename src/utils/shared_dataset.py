@@ -0,0 +1,92 @@
+import os
+import json
+import atexit
+import fcntl
+import contextlib
+from . import dataset_cache
+
+# A shared dataset is a dataset cache (see `dataset_cache`) in a directory on
+# a memory file system such as /dev/shm. Every process opens the arrays as
+# `np.memmap`, so they map the same pages and an extra process costs no RAM.
+# The pids of the processes using a dataset are kept in `<dataset_name>.refs`,
+# and the last process removes the files when it exits.
+
+_acquired = set()
+
+def get_lock_path(shared_dir, dataset_name):
+    return os.path.join(shared_dir, dataset_name + '.lock')
+
+def get_refs_path(shared_dir, dataset_name):
+    return os.path.join(shared_dir, dataset_name + '.refs')
+
+@contextlib.contextmanager
+def lock(shared_dir, dataset_name):
+    """Hold an exclusive lock on a shared dataset across processes."""
+    if not os.path.exists(shared_dir):
+        os.makedirs(shared_dir, exist_ok=True)
+    with open(get_lock_path(shared_dir, dataset_name), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def read_refs(shared_dir, dataset_name):
+    """Return the pids of the live processes using a shared dataset."""
+    path = get_refs_path(shared_dir, dataset_name)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [pid for pid in json.load(f) if is_alive(pid)]
+
+def write_refs(shared_dir, dataset_name, pids):
+    path = get_refs_path(shared_dir, dataset_name)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(pids, f)
+    os.replace(path + '.tmp', path)
+
+def acquire(shared_dir, dataset_name):
+    """Register this process as a user of a shared dataset.
+
+    Call this while holding `lock`. The dataset is released at exit.
+    """
+    pids = read_refs(shared_dir, dataset_name)
+    if os.getpid() not in pids:
+        pids.append(os.getpid())
+    write_refs(shared_dir, dataset_name, pids)
+    if (shared_dir, dataset_name) not in _acquired:
+        _acquired.add((shared_dir, dataset_name))
+        atexit.register(release, shared_dir, dataset_name)
+
+def release(shared_dir, dataset_name):
+    """Unregister this process and remove the dataset if it was the last."""
+    with lock(shared_dir, dataset_name):
+        pids = [pid for pid in read_refs(shared_dir, dataset_name)
+                if pid != os.getpid()]
+        if pids:
+            write_refs(shared_dir, dataset_name, pids)
+        else:
+            remove(shared_dir, dataset_name)
+    _acquired.discard((shared_dir, dataset_name))
+
+def remove(shared_dir, dataset_name):
+    """Delete the files of a shared dataset. The lock file is kept."""
+    paths = [get_refs_path(shared_dir, dataset_name)]
+    if dataset_cache.exists(shared_dir, dataset_name):
+        index = dataset_cache.load_index(shared_dir, dataset_name)
+        paths += [os.path.join(shared_dir, filename)
+                  for arrays in index.values()
+                  for filename in arrays.values() if filename is not None]
+        paths.append(dataset_cache.get_index_path(shared_dir, dataset_name))
+    for path in set(paths):
+        if os.path.exists(path):
+            os.remove(path)